@@ -1,12 +1,26 @@
 from flask import Flask, request, jsonify, render_template
-from phishing_detector import analyze_email
+from phishing_detector import analyze_email, VERDICT_CACHE
 from ocr_utils import extract_text_from_image
+from sender_reputation import SenderReputationStore
+import atexit
 import os
 
 app = Flask(__name__)
 UPLOAD_FOLDER = "uploads"
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+sender_reputation = SenderReputationStore()
+atexit.register(sender_reputation.close)
+
+def sender_history(sender):
+    """Messages seen from this sender in the ingested mail logs.
+
+    Only reads the store: analyzed messages are not counted, so submitting
+    the same phishing email again cannot make its sender look established.
+    History is loaded with ``python sender_reputation.py ingest <mail_log.csv>``.
+    """
+    return sender_reputation.history_count(sender)
+
 @app.route("/")
 def home():
     return render_template("index.html")
@@ -14,7 +28,11 @@ def home():
 @app.route("/analyze", methods=["POST"])
 def analyze_text():
     email_text = request.json.get("email", "")
-    report = analyze_email(email_text, sender_history_count=0)
+    sender = request.json.get("sender", "")
+    use_cache = not request.json.get("bypass_cache", False)
+    report = analyze_email(
+        email_text, sender_history_count=sender_history(sender), use_cache=use_cache
+    )
     return jsonify(report)
 
 @app.route("/analyze-image", methods=["POST"])
@@ -24,10 +42,15 @@ def analyze_image():
     file.save(file_path)
 
     extracted_text = extract_text_from_image(file_path)
-    report = analyze_email(extracted_text, sender_history_count=0)
+    sender = request.form.get("sender", "")
+    report = analyze_email(extracted_text, sender_history_count=sender_history(sender))
 
     report["Extracted Text"] = extracted_text
     return jsonify(report)
 
+@app.route("/cache-stats")
+def cache_stats():
+    return jsonify(VERDICT_CACHE.stats())
+
 if __name__ == "__main__":
     app.run(debug=True)
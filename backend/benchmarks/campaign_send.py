@@ -0,0 +1,279 @@
+"""Load-test campaign sending against an in-process fake provider and database.
+
+Runs the real launch path (streamed target pages into the send queue,
+tracking id minting and send window scheduling),
+queue worker, fair scheduler, adaptive rate control, renderer and status
+write-behind, with the email provider and Supabase replaced by fakes.
+
+Usage (from the backend directory):
+    python -m benchmarks.campaign_send --targets 100000
+    python -m benchmarks.campaign_send --campaigns 3 --targets 20000 \\
+        --latency 0.05 --error-rate 0.01 --provider-rate-limit 2000
+"""
+import argparse
+import asyncio
+import logging
+import os
+import resource
+import tempfile
+import time
+from array import array
+from typing import Any, Dict, List
+
+from services.email_transport import StubEmailTransport
+from services.supabase_client import SupabaseClient
+
+
+class TimedStubTransport(StubEmailTransport):
+    """Stub provider that records the latency of every request"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.latencies = array("d")
+
+    async def send(self, email_data, idempotency_key=None):
+        started = time.perf_counter()
+        try:
+            return await super().send(email_data, idempotency_key)
+        finally:
+            self.latencies.append(time.perf_counter() - started)
+
+    async def send_batch(self, payload, idempotency_key=None):
+        started = time.perf_counter()
+        try:
+            return await super().send_batch(payload, idempotency_key)
+        finally:
+            self.latencies.append(time.perf_counter() - started)
+
+
+class FakeSupabaseClient(SupabaseClient):
+    """Synthetic campaigns and targets; status writes only cost ``db_latency``"""
+
+    def __init__(self, targets: int, page_size: int, db_latency: float):
+        super().__init__()
+        self.targets = targets
+        self.page_size = page_size
+        self.db_latency = db_latency
+        self.status_writes = 0
+        self.rows_written = 0
+
+    async def get_campaign(self, campaign_id: str):
+        return {"id": campaign_id, "name": f"Load test {campaign_id}", "template_id": 2}
+
+    async def count_pending_campaign_targets(self, campaign_id: str) -> int:
+        return self.targets
+
+    async def iter_campaign_target_pages(self, campaign_id: str, page_size: int = 1000):
+        for start in range(0, self.targets, self.page_size):
+            yield [
+                {
+                    "id": f"{campaign_id}-{i}",
+                    "email": f"employee{i}@example.com",
+                    "name": f"Employee {i}",
+                    "department": f"Department {i % 12}",
+                    "employee_id": str(i),
+                    "campaign_target_id": f"{campaign_id}-{i % 12}",
+                }
+                for i in range(start, min(start + self.page_size, self.targets))
+            ]
+
+    async def bulk_update_target_status(self, rows: List[Dict[str, Any]]) -> bool:
+        if self.db_latency:
+            await asyncio.sleep(self.db_latency)
+        self.status_writes += 1
+        self.rows_written += len(rows)
+        return True
+
+    async def update_campaign_status(self, campaign_id: str, status: str) -> bool:
+        return True
+
+    async def update_campaign_stats(self, campaign_id: str, stats: Dict[str, Any]) -> bool:
+        return True
+
+    async def increment_campaign_stats(self, campaign_id: str, deltas: Dict[str, int]) -> bool:
+        return True
+
+    async def get_campaign_stats(self, campaign_id: str) -> Dict[str, Any]:
+        return {"total_sent": 0}
+
+
+async def monitor_loop_lag(samples: array, interval: float, stop: asyncio.Event):
+    """Measure how late the event loop wakes a sleeping task"""
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, time.perf_counter() - started - interval))
+
+
+def percentile(samples: array, pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+async def launch(worker, campaign_id: str, window_seconds: float, spread: str):
+    """The launch_campaign path: register the campaign, then queue its
+    targets with the same code the API runs"""
+    campaign = await worker.supabase_client.get_campaign(campaign_id)
+    total = await worker.supabase_client.count_pending_campaign_targets(campaign_id)
+    worker.campaign_sender.telemetry.start(campaign_id, total=total)
+    start_at = time.time()
+    await asyncio.to_thread(
+        worker.send_queue.register_campaign,
+        campaign,
+        campaign["template_id"],
+        loading=True,
+        start_at=start_at,
+        window_seconds=window_seconds,
+        spread=spread,
+    )
+    await worker.enqueue_campaign_targets(campaign, start_at, window_seconds, spread)
+
+
+async def run(args) -> Dict[str, Any]:
+    # Imported here so the environment set in main() is picked up
+    from services.campaign_sender import CampaignSender
+    from services.email_service import EmailService
+    from services.queue_worker import SendQueueWorker
+    from services.send_queue import SendQueue
+    from services.template_service import TemplateService
+
+    transport = TimedStubTransport(
+        latency=args.latency,
+        latency_jitter=args.latency_jitter,
+        error_rate=args.error_rate,
+        throttle_rate=args.throttle_rate,
+        rate_limit=args.provider_rate_limit,
+        retry_after=args.retry_after,
+    )
+    supabase_client = FakeSupabaseClient(args.targets, args.page_size, args.db_latency)
+    email_service = EmailService(transport=transport)
+    await email_service.initialize()
+    template_service = TemplateService()
+    campaign_sender = CampaignSender(email_service, template_service, supabase_client)
+
+    db_dir = tempfile.mkdtemp(prefix="send-queue-")
+    send_queue = SendQueue(os.path.join(db_dir, "send_queue.db"))
+    send_queue.initialize()
+    worker = SendQueueWorker(send_queue, campaign_sender, template_service, supabase_client)
+
+    lag = array("d")
+    stop_monitor = asyncio.Event()
+    monitor = asyncio.create_task(monitor_loop_lag(lag, 0.01, stop_monitor))
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    started = time.perf_counter()
+    worker_task = asyncio.create_task(worker.run())
+    campaign_ids = [f"loadtest-{i + 1}" for i in range(args.campaigns)]
+    await asyncio.gather(
+        *(launch(worker, c, args.send_window, args.spread) for c in campaign_ids)
+    )
+
+    last_report = time.perf_counter()
+    while send_queue.running_campaigns():
+        await asyncio.sleep(0.2)
+        if args.progress and time.perf_counter() - last_report >= args.progress:
+            last_report = time.perf_counter()
+            for campaign_id in campaign_ids:
+                snapshot = campaign_sender.telemetry.get(campaign_id).snapshot()
+                print(
+                    f"  {campaign_id}: {snapshot['completed']}/{snapshot['total']} "
+                    f"({snapshot['emails_per_second']['10s']}/s, "
+                    f"eta {snapshot['eta_seconds']}s)"
+                )
+    elapsed = time.perf_counter() - started
+
+    worker.stop()
+    await worker_task
+    await campaign_sender.status_writer.close()
+    await campaign_sender.counters.close()
+    stop_monitor.set()
+    await monitor
+    send_queue.close()
+    await email_service.close()
+
+    return {
+        "elapsed": elapsed,
+        "transport": transport,
+        "supabase": supabase_client,
+        "rate_control": campaign_sender.rate_control.metrics(),
+        "lag": lag,
+        "rss_before_kb": rss_before,
+        "rss_peak_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--targets", type=int, default=10_000, help="targets per campaign")
+    parser.add_argument("--campaigns", type=int, default=1)
+    parser.add_argument("--page-size", type=int, default=1000)
+    parser.add_argument("--latency", type=float, default=0.02, help="provider seconds per request")
+    parser.add_argument("--latency-jitter", type=float, default=0.005)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of 500s")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of 429s")
+    parser.add_argument(
+        "--provider-rate-limit", type=float, default=None, help="provider requests/sec"
+    )
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--db-latency", type=float, default=0.01, help="seconds per status write")
+    parser.add_argument("--rate", type=float, default=5000, help="initial provider requests/sec")
+    parser.add_argument("--max-rate", type=float, default=50_000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--progress", type=float, default=5.0, help="seconds between reports")
+    parser.add_argument(
+        "--send-window", type=float, default=0.0, help="seconds to spread each campaign over"
+    )
+    parser.add_argument("--spread", choices=("even", "department"), default="even")
+    args = parser.parse_args()
+
+    os.environ.update(
+        {
+            "CAMPAIGN_SEND_RATE": str(args.rate),
+            "CAMPAIGN_SEND_BURST": str(args.rate),
+            "CAMPAIGN_SEND_MAX_RATE": str(args.max_rate),
+            "CAMPAIGN_SEND_CONCURRENCY": str(args.concurrency),
+            "CAMPAIGN_SEND_RETRY_DELAY": "0.05",
+            "SEND_QUEUE_RETRY_DELAY": "0",
+            "SEND_QUEUE_POLL_INTERVAL": "0.05",
+        }
+    )
+    # Per-email log lines would dominate the profile
+    logging.basicConfig(level=logging.WARNING)
+    logging.getLogger("services").setLevel(logging.CRITICAL)
+
+    total = args.targets * args.campaigns
+    print(f"Sending {args.campaigns} campaign(s) x {args.targets:,} targets")
+    result = asyncio.run(run(args))
+
+    transport = result["transport"]
+    elapsed = result["elapsed"]
+    print(f"\nSent {transport.sent:,}/{total:,} emails in {elapsed:.2f}s")
+    print(f"  throughput        {transport.sent / elapsed:>12,.0f} emails/sec")
+    print(
+        f"  provider requests {transport.requests:>12,} "
+        f"({transport.errors:,} errors, {transport.throttled:,} throttled)"
+    )
+    print(
+        f"  send latency      p50 {1000 * percentile(transport.latencies, 50):.1f} ms, "
+        f"p99 {1000 * percentile(transport.latencies, 99):.1f} ms"
+    )
+    print(
+        f"  event loop lag    p99 {1000 * percentile(result['lag'], 99):.1f} ms, "
+        f"max {1000 * max(result['lag'], default=0.0):.1f} ms"
+    )
+    print(
+        f"  memory high-water {result['rss_peak_kb'] / 1024:>9,.1f} MB "
+        f"(+{(result['rss_peak_kb'] - result['rss_before_kb']) / 1024:,.1f} MB while sending)"
+    )
+    supabase = result["supabase"]
+    print(
+        f"  status writes     {supabase.status_writes:>12,} "
+        f"({supabase.rows_written:,} rows)"
+    )
+    print(f"  final rate        {result['rate_control']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,34 @@
-from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Depends, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import (
+    HTMLResponse,
+    RedirectResponse,
+    Response,
+    StreamingResponse,
+)
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 from pydantic import BaseModel, EmailStr
 from typing import List, Optional, Dict, Any
 import os
+import base64
 import asyncio
+import json
+import time
 import logging
-from datetime import datetime
-import uuid
+from datetime import datetime, timedelta
 from dotenv import load_dotenv
 
 from services.supabase_client import SupabaseClient
 from services.email_service import EmailService
 from services.template_service import TemplateService
 from services.phishing_detector import PhishingDetector
+from services.campaign_sender import CampaignSender
+from services.send_queue import SendQueue
+from services.queue_worker import SendQueueWorker
+from services.page_cache import PageCache
+from services.tracking_ingest import TrackingEventIngest
+from services.stats_cache import CampaignStatsCache
 from models.schemas import (
     CampaignCreate,
     EmailTarget,
@@ -56,6 +69,24 @@ supabase_client = SupabaseClient()
 email_service = EmailService()
 template_service = TemplateService()
 phishing_detector = PhishingDetector()
+campaign_sender = CampaignSender(email_service, template_service, supabase_client)
+send_queue = SendQueue()
+queue_worker = SendQueueWorker(
+    send_queue, campaign_sender, template_service, supabase_client
+)
+queue_worker_task: Optional[asyncio.Task] = None
+counters_task: Optional[asyncio.Task] = None
+partitions_task: Optional[asyncio.Task] = None
+loading_task: Optional[asyncio.Task] = None
+page_cache = PageCache(template_service)
+tracking_ingest = TrackingEventIngest(supabase_client, campaign_sender.counters)
+stats_cache = CampaignStatsCache(supabase_client)
+campaign_sender.counters.add_listener(stats_cache.invalidate)
+
+# 1x1 transparent GIF served by the open-tracking pixel
+TRACKING_PIXEL = base64.b64decode(
+    "R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7"
+)
 
 # Mount static files and templates
 templates = Jinja2Templates(directory="templates")
@@ -68,9 +99,50 @@ async def startup_event():
     await supabase_client.initialize()
     await email_service.initialize()
     await phishing_detector.initialize()
+    send_queue.initialize()
+
+    # Run a send worker inside the API process unless dedicated workers
+    # (worker.py) are deployed
+    global queue_worker_task, counters_task, partitions_task, loading_task
+    if os.getenv("SEND_WORKER_EMBEDDED", "true").lower() == "true":
+        queue_worker_task = asyncio.create_task(queue_worker.run())
+    # Finish queueing campaigns whose launch failed or was cut short by a restart
+    loading_task = asyncio.create_task(queue_worker.resume_loading())
+    counters_task = asyncio.create_task(campaign_sender.counters.run())
+    partitions_task = asyncio.create_task(maintain_tracking_partitions())
+
     logger.info("AICDAP Backend started successfully")
 
 
+async def maintain_tracking_partitions():
+    """Create the coming months' tracking_events partitions, now and then
+    every TRACKING_PARTITION_INTERVAL_HOURS, so events never pile up in the
+    default partition"""
+    interval = float(os.getenv("TRACKING_PARTITION_INTERVAL_HOURS", 24)) * 3600
+    while True:
+        await supabase_client.create_tracking_table_if_not_exists()
+        await asyncio.sleep(interval)
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release service resources on shutdown"""
+    if queue_worker_task:
+        queue_worker.stop()
+        await queue_worker_task
+    send_queue.close()
+    await campaign_sender.status_writer.close()
+    await tracking_ingest.close()
+    await campaign_sender.counters.close()
+    if counters_task:
+        await counters_task
+    if partitions_task:
+        partitions_task.cancel()
+    if loading_task:
+        loading_task.cancel()
+    await email_service.close()
+
+
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -104,9 +176,11 @@ async def launch_campaign(
         if not campaign:
             raise HTTPException(status_code=404, detail="Campaign not found")
 
-        # Get target employees
-        targets = await supabase_client.get_campaign_targets(campaign_data.campaign_id)
-        if not targets:
+        # Count target employees; they are streamed into the queue below
+        targets_count = await supabase_client.count_pending_campaign_targets(
+            campaign_data.campaign_id
+        )
+        if not targets_count:
             raise HTTPException(status_code=400, detail="No targets found for campaign")
 
         # Get email template
@@ -114,8 +188,32 @@ async def launch_campaign(
         if not template:
             raise HTTPException(status_code=400, detail="Email template not found")
 
-        # Start email sending in background
-        background_tasks.add_task(send_campaign_emails, campaign, targets, template)
+        if campaign_data.spread not in ("even", "department"):
+            raise HTTPException(status_code=400, detail="Invalid spread")
+
+        # Queue durable send jobs page by page, so workers start sending the
+        # first page while later ones are still loading
+        start_at = time.time() + (campaign_data.delay_minutes or 0) * 60
+        window_seconds = (campaign_data.send_window_minutes or 0) * 60
+        campaign_sender.telemetry.start(campaign["id"], total=targets_count)
+        await asyncio.to_thread(
+            send_queue.register_campaign,
+            campaign,
+            template["template_id"],
+            loading=True,
+            priority=campaign_data.priority,
+            max_rate=campaign_data.max_rate,
+            start_at=start_at,
+            window_seconds=window_seconds,
+            spread=campaign_data.spread,
+        )
+        background_tasks.add_task(
+            queue_worker.enqueue_campaign_targets,
+            campaign,
+            start_at,
+            window_seconds,
+            campaign_data.spread,
+        )
 
         # Update campaign status
         await supabase_client.update_campaign_status(
@@ -126,7 +224,7 @@ async def launch_campaign(
             campaign_id=campaign_data.campaign_id,
             status="launched",
             message="Campaign launched successfully",
-            targets_count=len(targets),
+            targets_count=targets_count,
         )
 
     except Exception as e:
@@ -134,80 +232,17 @@ async def launch_campaign(
         raise HTTPException(status_code=500, detail=str(e))
 
 
-async def send_campaign_emails(campaign: Dict, targets: List[Dict], template: Dict):
-    """Send emails to all targets in a campaign"""
-    try:
-        logger.info(f"Sending emails for campaign: {campaign['name']}")
-
-        sent_count = 0
-        failed_count = 0
-
-        for target in targets:
-            try:
-                # Generate tracking URLs
-                tracking_id = str(uuid.uuid4())
-                tracking_urls = {
-                    "open": f"http://localhost:8000/track/open/{tracking_id}",
-                    "click": f"http://localhost:8000/track/click/{tracking_id}",
-                    "landing": f"http://localhost:8000/landing/{template['template_id']}/{tracking_id}",
-                }
-
-                # Personalize email content
-                personalized_content = template_service.personalize_template(
-                    template, target, tracking_urls
-                )
-
-                # Send email
-                success = await email_service.send_email(
-                    to_email=target["email"],
-                    subject=personalized_content["subject"],
-                    html_content=personalized_content["html"],
-                    tracking_id=tracking_id,
-                )
-
-                if success:
-                    sent_count += 1
-                    # Update target status in database
-                    await supabase_client.update_target_status(
-                        target["id"],
-                        "sent",
-                        tracking_id=tracking_id,
-                        metadata={
-                            "sent_at": datetime.utcnow().isoformat(),
-                        },
-                    )
-                else:
-                    failed_count += 1
-                    await supabase_client.update_target_status(
-                        target["id"], "failed", {"error": "Failed to send email"}
-                    )
-
-                # Small delay to avoid rate limiting
-                await asyncio.sleep(0.1)
-
-            except Exception as e:
-                logger.error(f"Error sending email to {target['email']}: {str(e)}")
-                failed_count += 1
-                await supabase_client.update_target_status(
-                    target["id"], "failed", {"error": str(e)}
-                )
-
-        # Update campaign statistics
-        await supabase_client.update_campaign_stats(
-            campaign["id"],
-            {
-                "total_sent": sent_count,
-                "status": "active" if sent_count > 0 else "failed",
-            },
-        )
-
-        logger.info(
-            f"Campaign {campaign['name']} completed. Sent: {sent_count}, Failed: {failed_count}"
-        )
-
-    except Exception as e:
-        logger.error(f"Error in send_campaign_emails: {str(e)}")
-        await supabase_client.update_campaign_status(campaign["id"], "failed")
+@app.get("/api/sending/metrics")
+async def get_sending_metrics():
+    """Current adaptive send rate, concurrency and backoff state, and the
+    queue depth and throughput of each running campaign"""
+    metrics = campaign_sender.rate_control.metrics()
+    metrics["campaigns"] = await asyncio.to_thread(queue_worker.campaign_metrics)
+    metrics["status_writer"] = campaign_sender.status_writer.metrics()
+    metrics["tracking_ingest"] = tracking_ingest.metrics()
+    metrics["stats_cache"] = stats_cache.metrics()
+    metrics["tracking_cache"] = supabase_client.tracking_cache.metrics()
+    return metrics
 
 
 @app.get("/api/templates")
@@ -217,6 +252,12 @@ async def get_templates():
     return {"templates": templates}
 
 
+@app.get("/api/templates/size-report")
+async def get_template_size_report():
+    """Email body size before and after CSS inlining and minification"""
+    return {"templates": template_service.size_report}
+
+
 @app.get("/api/templates/{template_id}")
 async def get_template(template_id: int):
     """Get a specific email template"""
@@ -230,33 +271,34 @@ async def get_template(template_id: int):
 async def track_email_open(tracking_id: str):
     """Track email opens"""
     try:
-        await supabase_client.record_tracking_event(
-            tracking_id, "opened", {"timestamp": datetime.utcnow().isoformat()}
-        )
-
-        # Return 1x1 transparent pixel
-        return HTMLResponse(
-            content='<img src="data:image/gif;base64,R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7" alt="">',
-            media_type="image/gif",
+        tracking_ingest.submit(
+            tracking_id,
+            "opened",
+            {"timestamp": datetime.utcnow().isoformat()},
+            token=campaign_sender.tracking_tokens.decode(tracking_id),
         )
     except Exception as e:
         logger.error(f"Error tracking email open: {str(e)}")
-        return HTMLResponse(content="", status_code=200)
+
+    # Always answer with the pixel; a cached copy would hide later opens
+    return Response(
+        content=TRACKING_PIXEL,
+        media_type="image/gif",
+        headers={"Cache-Control": "no-store, max-age=0"},
+    )
 
 
 @app.get("/track/click/{tracking_id}")
 async def track_email_click(tracking_id: str):
     """Track email clicks"""
     try:
-        campaign_id = await supabase_client.record_tracking_event(
-            tracking_id, "clicked", {"timestamp": datetime.utcnow().isoformat()}
+        tracking_ingest.submit(
+            tracking_id,
+            "clicked",
+            {"timestamp": datetime.utcnow().isoformat()},
+            token=campaign_sender.tracking_tokens.decode(tracking_id),
         )
 
-        if campaign_id:
-            # Update campaign stats
-            stats = await supabase_client.get_campaign_stats(campaign_id)
-            await supabase_client.update_campaign_stats(campaign_id, stats)
-
         # Redirect to landing page
         return RedirectResponse(url=f"/landing/generic/{tracking_id}")
 
@@ -266,20 +308,21 @@ async def track_email_click(tracking_id: str):
 
 
 @app.get("/landing/{template_id}/{tracking_id}", response_class=HTMLResponse)
-async def phishing_landing_page(template_id: str, tracking_id: str):
+async def phishing_landing_page(request: Request, template_id: str, tracking_id: str):
     """Serve phishing landing pages"""
     try:
         # Record landing page visit
-        campaign_id = await supabase_client.record_tracking_event(
+        tracking_ingest.submit(
             tracking_id,
             "landed",
             {"timestamp": datetime.utcnow().isoformat(), "template_id": template_id},
+            token=campaign_sender.tracking_tokens.decode(tracking_id),
         )
 
-        if campaign_id:
-            # Update campaign stats
-            stats = await supabase_client.get_campaign_stats(campaign_id)
-            await supabase_client.update_campaign_stats(campaign_id, stats)
+        # Serve the pre-rendered page when the template can be cached
+        landing_page = page_cache.landing_page(template_id)
+        if landing_page:
+            return page_cache.landing_response(request, landing_page, tracking_id)
 
         # Get landing page template
         landing_template = template_service.get_landing_template(template_id)
@@ -305,8 +348,9 @@ async def handle_landing_submission(
 ):
     """Handle form submissions from landing pages"""
     try:
-        # Record form submission
-        await supabase_client.record_tracking_event(
+        # Record form submission; write it directly if the buffer is full
+        # rather than lose it
+        event = (
             tracking_id,
             "submitted",
             {
@@ -317,6 +361,9 @@ async def handle_landing_submission(
                 "user_agent": form_data.get("user_agent"),
             },
         )
+        token = campaign_sender.tracking_tokens.decode(tracking_id)
+        if not tracking_ingest.submit(*event, token=token):
+            await supabase_client.record_tracking_event(*event, token=token)
 
         # Return success response or redirect to awareness page
         return {
@@ -331,31 +378,152 @@ async def handle_landing_submission(
 
 
 @app.get("/awareness", response_class=HTMLResponse)
-async def awareness_page():
+async def awareness_page(request: Request):
     """Security awareness education page"""
-    return templates.TemplateResponse("awareness.html", {"request": {}})
+    page = page_cache.static_page(
+        "awareness",
+        lambda: templates.get_template("awareness.html").render({"request": {}}),
+    )
+    return page_cache.static_response(request, page)
 
 
 @app.get("/api/campaigns/{campaign_id}/stats")
-async def get_campaign_stats(campaign_id: str):
-    """Get campaign statistics"""
+async def get_campaign_stats(campaign_id: str, request: Request):
+    """Get campaign statistics, answering 304 while they are unchanged"""
     try:
-        stats = await supabase_client.get_campaign_stats(campaign_id)
-        return stats
+        cached = await stats_cache.get(campaign_id)
+        headers = {"ETag": cached.etag, "Cache-Control": "private, no-cache"}
+        if cached.matches(request.headers.get("if-none-match")):
+            return Response(status_code=304, headers=headers)
+        return Response(
+            content=cached.body, media_type="application/json", headers=headers
+        )
     except Exception as e:
         logger.error(f"Error getting campaign stats: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/campaigns/{campaign_id}/timeline")
+async def get_campaign_timeline(
+    campaign_id: str,
+    bucket: str = "hour",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    department: Optional[str] = None,
+    event_type: Optional[str] = None,
+    by_department: bool = False,
+):
+    """Event counts of a campaign per minute or hour, read from the rollups.
+
+    Minute buckets default to the last 24 hours. Departments are summed
+    together unless ``by_department`` is set.
+    """
+    if bucket not in ("minute", "hour"):
+        raise HTTPException(status_code=400, detail="bucket must be 'minute' or 'hour'")
+    if bucket == "minute" and since is None:
+        since = datetime.utcnow() - timedelta(days=1)
+
+    rows = await supabase_client.get_campaign_timeline(
+        campaign_id, bucket, since, until, department, event_type
+    )
+    points: Dict[tuple, Dict[str, Any]] = {}
+    for row in rows:
+        key = (row["bucket_start"], row["event_type"])
+        if by_department:
+            key += (row["department"],)
+        point = points.get(key)
+        if point is None:
+            point = points[key] = {
+                "bucket_start": row["bucket_start"],
+                "event_type": row["event_type"],
+                "count": 0,
+            }
+            if by_department:
+                point["department"] = row["department"]
+        point["count"] += row["event_count"]
+
+    return {"campaign_id": campaign_id, "bucket": bucket, "points": list(points.values())}
+
+
+async def _campaign_progress(campaign_id: str) -> Optional[Dict[str, Any]]:
+    """Send progress of a campaign, or None if no sender has queued it.
+
+    The sender in this process has live throughput and latencies; otherwise
+    the counts come from the send queue shared with the worker processes,
+    which also tells when the campaign is finished.
+    """
+    queued = await asyncio.to_thread(send_queue.campaign_progress, campaign_id)
+    progress = campaign_sender.telemetry.get(campaign_id)
+    if progress is None:
+        return dict(queued, source="queue") if queued else None
+
+    snapshot = dict(progress.snapshot(), source="sender")
+    if queued and queued["finished"]:
+        # Finished by another worker process
+        snapshot.update(queued)
+    return snapshot
+
+
+@app.get("/api/campaigns/{campaign_id}/progress")
+async def get_campaign_progress(campaign_id: str):
+    """Send progress of a campaign"""
+    progress = await _campaign_progress(campaign_id)
+    if not progress:
+        raise HTTPException(status_code=404, detail="No send in progress for campaign")
+    return progress
+
+
+@app.get("/api/campaigns/{campaign_id}/progress/stream")
+async def stream_campaign_progress(campaign_id: str, request: Request):
+    """Server-Sent Events stream of a campaign's send progress.
+
+    A ``progress`` event is pushed at most once a second while the numbers
+    change, a comment keeps idle connections open, and the stream ends
+    after the event that reports the campaign finished. A campaign no
+    sender has queued gets a single ``unavailable`` event instead.
+    """
+    interval = float(os.getenv("PROGRESS_STREAM_INTERVAL", 1.0))
+    heartbeat = 15.0
+
+    async def events():
+        last_progress = None
+        last_sent = time.monotonic()
+        while not await request.is_disconnected():
+            progress = await _campaign_progress(campaign_id)
+            if progress is None:
+                data = {"campaign_id": campaign_id, "reason": "Campaign is not being sent"}
+                yield f"event: unavailable\ndata: {json.dumps(data)}\n\n"
+                return
+            if progress != last_progress:
+                last_progress = progress
+                last_sent = time.monotonic()
+                yield f"event: progress\ndata: {json.dumps(progress)}\n\n"
+                if progress["finished"]:
+                    return
+            elif time.monotonic() - last_sent >= heartbeat:
+                last_sent = time.monotonic()
+                yield ": keep-alive\n\n"
+            await asyncio.sleep(interval)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.post("/api/campaigns/{campaign_id}/report")
 async def report_phishing_email(campaign_id: str, tracking_id: str):
     """Handle phishing email reports"""
     try:
-        await supabase_client.record_tracking_event(
+        event = (
             tracking_id,
             "reported",
             {"timestamp": datetime.utcnow().isoformat(), "campaign_id": campaign_id},
         )
+        token = campaign_sender.tracking_tokens.decode(tracking_id)
+        if not tracking_ingest.submit(*event, token=token):
+            await supabase_client.record_tracking_event(*event, token=token)
 
         return {
             "status": "success",
@@ -65,7 +65,19 @@ class CampaignCreate(BaseModel):
     description: Optional[str] = None
     template_id: int = Field(..., description="Email template ID to use")
     delay_minutes: Optional[int] = Field(
-        default=0, description="Delay before sending emails"
+        default=0, ge=0, description="Delay before sending emails"
+    )
+    send_window_minutes: Optional[int] = Field(
+        default=0, ge=0, description="Spread sends over this many minutes after the delay"
+    )
+    spread: Optional[str] = Field(
+        default="even", description="How to spread sends: even or department"
+    )
+    priority: int = Field(
+        default=1, ge=1, description="Share of the send rate relative to other campaigns"
+    )
+    max_rate: Optional[float] = Field(
+        default=None, gt=0, description="Maximum emails per second for this campaign"
     )
 
 
@@ -0,0 +1,186 @@
+import re
+import logging
+from typing import Dict, List, Any, Tuple, Union
+
+from jinja2 import Environment, Template, nodes
+
+logger = logging.getLogger(__name__)
+
+# Per-recipient values in the personalization context, as (key, sub_key)
+RECIPIENT_SLOTS: List[Tuple[str, Any]] = [
+    ("employee_name", None),
+    ("employee_email", None),
+    ("department", None),
+    ("current_time", None),
+    ("tracking_urls", "open"),
+    ("tracking_urls", "click"),
+    ("tracking_urls", "landing"),
+]
+
+_SENTINEL = re.compile("\x00slot(\\d+)\x00")
+
+
+def _sentinel(index: int) -> str:
+    return f"\x00slot{index}\x00"
+
+
+def _sentinel_context() -> Dict[str, Any]:
+    context: Dict[str, Any] = {"tracking_urls": {}}
+    for index, (key, sub_key) in enumerate(RECIPIENT_SLOTS):
+        if sub_key is None:
+            context[key] = _sentinel(index)
+        else:
+            context[key][sub_key] = _sentinel(index)
+    return context
+
+
+def slot_values(context: Dict[str, Any]) -> Tuple[str, ...]:
+    """Extract the per-recipient values from a personalization context"""
+    values = []
+    for key, sub_key in RECIPIENT_SLOTS:
+        value = context.get(key)
+        if sub_key is not None:
+            value = (value or {}).get(sub_key)
+        values.append(str(value))
+    return tuple(values)
+
+
+# Slots whose value differs for every recipient, so renders using them
+# are never worth memoizing
+_UNIQUE_SLOTS = {
+    index
+    for index, (key, sub_key) in enumerate(RECIPIENT_SLOTS)
+    if key in ("employee_email", "tracking_urls")
+}
+_RECIPIENT_KEYS = {key for key, _ in RECIPIENT_SLOTS}
+_TRACKING_KEYS = {sub_key for key, sub_key in RECIPIENT_SLOTS if sub_key is not None}
+
+
+def _plain_slot(node: nodes.Node) -> bool:
+    """True for ``{{ employee_name }}`` or ``{{ tracking_urls.open }}`` style output"""
+    # build_context defines every recipient value, so a plain default()
+    # never replaces one
+    if (
+        isinstance(node, nodes.Filter)
+        and node.name == "default"
+        and len(node.args) <= 1
+        and not node.kwargs
+        and node.dyn_args is None
+        and node.dyn_kwargs is None
+    ):
+        return node.node is not None and _plain_slot(node.node)
+    if isinstance(node, nodes.Name):
+        return node.name in _RECIPIENT_KEYS and node.name != "tracking_urls"
+    if isinstance(node, nodes.Getattr):
+        target, attr = node.node, node.attr
+    elif isinstance(node, nodes.Getitem) and isinstance(node.arg, nodes.Const):
+        target, attr = node.node, node.arg.value
+    else:
+        return False
+    return (
+        isinstance(target, nodes.Name)
+        and target.name == "tracking_urls"
+        and attr in _TRACKING_KEYS
+    )
+
+
+def partially_evaluable(env: Environment, source: str) -> bool:
+    """Whether recipient values only ever appear as plain ``{{ var }}`` output.
+
+    Anything else (a filter, a test in ``{% if %}``, a ``{% set %}``, a
+    loop, an include that could do any of those) may make the output
+    depend on a recipient value in a way a sentinel render cannot capture.
+    """
+    tree = env.parse(source)
+    if any(tree.find_all((nodes.Extends, nodes.Include, nodes.Import, nodes.FromImport))):
+        return False
+
+    plain = set()
+    for output in tree.find_all(nodes.Output):
+        for child in output.nodes:
+            if _plain_slot(child):
+                plain.add(id(child))
+                plain.update(id(n) for n in child.find_all(nodes.Name))
+
+    return all(
+        id(name) in plain
+        for name in tree.find_all(nodes.Name)
+        if name.name in _RECIPIENT_KEYS
+    )
+
+
+class PartialTemplate:
+    """A template pre-rendered into static fragments and recipient slots.
+
+    The template is rendered once with a sentinel in place of every
+    per-recipient value, then split on the sentinels. Rendering for a
+    recipient is a join of the fragments with the recipient's values. This
+    is only done when the template's syntax tree shows recipient values
+    are output as-is; otherwise the template is rendered normally.
+    """
+
+    def __init__(self, env: Environment, template: Template, source: str):
+        self.template = template
+        self.fragments: List[Union[str, int]] = []
+        self.partial = partially_evaluable(env, source)
+        if self.partial:
+            pieces = _SENTINEL.split(template.render(_sentinel_context()))
+            for index, piece in enumerate(pieces):
+                if index % 2:
+                    self.fragments.append(int(piece))
+                elif piece:
+                    self.fragments.append(piece)
+
+        self.slots = tuple(sorted({f for f in self.fragments if isinstance(f, int)}))
+        # Only parts without per-recipient values (e.g. a subject using the
+        # department) repeat, so only those are memoized
+        self.memoize = self.partial and not _UNIQUE_SLOTS & set(self.slots)
+        self._memo: Dict[Tuple[str, ...], str] = {}
+        self.max_memo = 1000
+
+    def _join(self, values: Tuple[str, ...]) -> str:
+        return "".join(
+            values[f] if isinstance(f, int) else f for f in self.fragments
+        )
+
+    def render(self, context: Dict[str, Any], values: Tuple[str, ...]) -> str:
+        if not self.partial:
+            return self.template.render(context)
+        if not self.memoize:
+            return self._join(values)
+
+        key = tuple(values[slot] for slot in self.slots)
+        rendered = self._memo.get(key)
+        if rendered is None:
+            rendered = self._join(values)
+            if len(self._memo) >= self.max_memo:
+                self._memo.clear()
+            self._memo[key] = rendered
+        return rendered
+
+
+class BulkTemplate:
+    """Partially evaluated subject and HTML body of one email template"""
+
+    def __init__(
+        self,
+        env: Environment,
+        subject: Template,
+        subject_source: str,
+        html: Template,
+        html_source: str,
+    ):
+        self.subject = PartialTemplate(env, subject, subject_source)
+        self.html = PartialTemplate(env, html, html_source)
+        if not (self.subject.partial and self.html.partial):
+            logger.warning(
+                "Template uses recipient values in logic or filters; "
+                "falling back to full rendering for part of it"
+            )
+
+    def render(self, context: Dict[str, Any]) -> Dict[str, str]:
+        values = slot_values(context)
+        return {
+            "subject": self.subject.render(context, values),
+            "html": self.html.render(context, values),
+        }
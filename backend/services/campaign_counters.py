@@ -0,0 +1,148 @@
+import os
+import asyncio
+import logging
+from typing import Callable, Dict, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+COUNTERS = (
+    "total_sent",
+    "total_opened",
+    "total_clicked",
+    "total_submitted",
+    "total_reported",
+    "total_failed",
+)
+
+
+class CampaignCounters:
+    """Incrementally maintained campaign totals.
+
+    Status transitions add to per-campaign deltas in memory, and a
+    background flusher applies them every ``flush_interval`` as one atomic
+    ``increment_campaign_stats`` call per campaign, so recording a click no
+    longer recounts the whole campaign. Counts can still drift (several
+    processes racing on the same target, writes lost on a crash), so
+    ``run`` periodically recounts the campaigns that changed and writes
+    the exact totals back.
+    """
+
+    def __init__(self, supabase_client):
+        self.supabase_client = supabase_client
+        self.flush_interval = float(os.getenv("CAMPAIGN_COUNTERS_FLUSH_MS", 1000)) / 1000
+        self.reconcile_interval = float(os.getenv("CAMPAIGN_STATS_RECONCILE_SECONDS", 300))
+
+        self._deltas: Dict[str, Dict[str, int]] = {}
+        self._dirty: Set[str] = set()
+        self._flush_lock = asyncio.Lock()
+        self._flusher: Optional[asyncio.Task] = None
+        self._stopping = asyncio.Event()
+        self._listeners: List[Callable[[str], None]] = []
+        self.flushes = 0
+        self.reconciled = 0
+
+    def add_listener(self, listener: Callable[[str], None]):
+        """Call ``listener(campaign_id)`` whenever a campaign's totals change"""
+        self._listeners.append(listener)
+
+    def _changed(self, campaign_id: str):
+        self._dirty.add(campaign_id)
+        for listener in self._listeners:
+            listener(campaign_id)
+
+    def add(self, campaign_id: str, counter: str, count: int = 1):
+        """Count ``count`` transitions of a campaign's targets into ``counter``"""
+        if counter not in COUNTERS:
+            raise ValueError(f"Unknown campaign counter: {counter}")
+        if not count:
+            return
+        campaign_id = str(campaign_id)
+        deltas = self._deltas.setdefault(campaign_id, {})
+        deltas[counter] = deltas.get(counter, 0) + count
+        self._changed(campaign_id)
+
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._run_flusher())
+
+    def mark_dirty(self, campaign_id: str):
+        """Schedule a campaign for reconciliation without counting anything"""
+        self._changed(str(campaign_id))
+
+    def pending(self, campaign_id: str) -> Dict[str, int]:
+        """Deltas of a campaign not yet written to the database"""
+        return dict(self._deltas.get(str(campaign_id), {}))
+
+    async def _run_flusher(self):
+        while self._deltas and not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
+
+    async def flush(self) -> int:
+        """Apply all pending deltas; returns the number of campaigns written"""
+        async with self._flush_lock:
+            deltas, self._deltas = self._deltas, {}
+            written = 0
+            for campaign_id, counts in deltas.items():
+                if await self.supabase_client.increment_campaign_stats(campaign_id, counts):
+                    written += 1
+                    continue
+                logger.warning(f"Requeueing counter deltas of campaign {campaign_id}")
+                self._requeue(campaign_id, counts)
+            if written:
+                self.flushes += 1
+            return written
+
+    def _requeue(self, campaign_id: str, counts: Dict[str, int]):
+        """Keep deltas that could not be written for the next flush"""
+        pending = self._deltas.setdefault(campaign_id, {})
+        for counter, count in counts.items():
+            pending[counter] = pending.get(counter, 0) + count
+        if not pending:
+            del self._deltas[campaign_id]
+
+    async def reconcile(self, campaign_id: str) -> bool:
+        """Recount a campaign from its targets and overwrite its totals"""
+        campaign_id = str(campaign_id)
+        async with self._flush_lock:
+            # Deltas counted before the recount are part of it
+            pending = self._deltas.pop(campaign_id, None)
+            self._dirty.discard(campaign_id)
+            stats = await self.supabase_client.get_campaign_stats(campaign_id)
+            if not stats or not await self.supabase_client.update_campaign_stats(
+                campaign_id, stats
+            ):
+                self._requeue(campaign_id, pending or {})
+                self._dirty.add(campaign_id)
+                return False
+        self.reconciled += 1
+        return True
+
+    async def run(self):
+        """Reconcile the campaigns that changed, every ``reconcile_interval``"""
+        logger.info("Campaign counter reconciliation started")
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.reconcile_interval)
+            except asyncio.TimeoutError:
+                pass
+            if self._stopping.is_set():
+                break
+            for campaign_id in list(self._dirty):
+                try:
+                    await self.reconcile(campaign_id)
+                except Exception as e:
+                    logger.error(f"Error reconciling campaign {campaign_id}: {str(e)}")
+        logger.info("Campaign counter reconciliation stopped")
+
+    def stop(self):
+        self._stopping.set()
+
+    async def close(self):
+        """Stop the flusher and write what is still pending"""
+        self.stop()
+        if self._flusher and not self._flusher.done():
+            await self._flusher
+        await self.flush()
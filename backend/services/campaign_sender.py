@@ -0,0 +1,278 @@
+import os
+import asyncio
+import logging
+import random
+import time
+import uuid
+from datetime import datetime
+from typing import Dict, Any, Iterable, List, Optional, Callable, Tuple
+
+from services.campaign_counters import CampaignCounters
+from services.email_service import batch_idempotency_key
+from services.email_transport import EmailProviderError
+from services.send_telemetry import SendTelemetry
+from services.status_writer import TargetStatusWriter
+from utils.rate_limiter import AIMDController, TokenBucket
+from utils.tracking_tokens import TrackingToken, TrackingTokenCodec
+
+logger = logging.getLogger(__name__)
+
+
+class CampaignSender:
+    """Sends campaign emails through a bounded worker pool and a shared rate limit"""
+
+    def __init__(self, email_service, template_service, supabase_client):
+        self.email_service = email_service
+        self.template_service = template_service
+        self.supabase_client = supabase_client
+        self.status_writer = TargetStatusWriter(supabase_client)
+        self.counters = CampaignCounters(supabase_client)
+        self.telemetry = SendTelemetry()
+        self.tracking_tokens = TrackingTokenCodec.from_env()
+
+        self.concurrency = int(os.getenv("CAMPAIGN_SEND_CONCURRENCY", 10))
+        self.max_retries = int(os.getenv("CAMPAIGN_SEND_MAX_RETRIES", 3))
+        self.retry_base_delay = float(os.getenv("CAMPAIGN_SEND_RETRY_DELAY", 0.5))
+        # Targets per provider request
+        self.batch_size = max(1, int(getattr(email_service, "batch_size", 1)))
+
+        # One bucket for the whole process so concurrent campaigns share the
+        # provider quota
+        self.rate_limiter = TokenBucket(
+            rate=float(os.getenv("CAMPAIGN_SEND_RATE", 10)),
+            capacity=float(os.getenv("CAMPAIGN_SEND_BURST", 10)),
+        )
+        # Adapts the bucket's rate and the number of requests in flight to
+        # the provider's throttling
+        latency_target = os.getenv("CAMPAIGN_SEND_LATENCY_TARGET_MS")
+        self.rate_control = AIMDController(
+            self.rate_limiter,
+            max_concurrency=self.concurrency,
+            min_rate=float(os.getenv("CAMPAIGN_SEND_MIN_RATE", 1)),
+            max_rate=float(os.getenv("CAMPAIGN_SEND_MAX_RATE", 100)),
+            latency_target=float(latency_target) / 1000 if latency_target else None,
+        )
+
+    def new_tracking_id(self, campaign: Dict[str, Any], target: Dict[str, Any]) -> str:
+        """Generate the tracking id embedded in a target's email.
+
+        With signing keys configured this is a signed token carrying the
+        target and campaign ids, so tracking hits need no lookup. Random ids
+        are cached with their target and campaign for the same effect while
+        they stay in the cache.
+        """
+        if self.tracking_tokens.enabled:
+            return self.tracking_tokens.encode(target["id"], campaign["id"])
+        tracking_id = str(uuid.uuid4())
+        self.supabase_client.tracking_cache.put(
+            tracking_id, TrackingToken(str(target["id"]), str(campaign["id"]))
+        )
+        return tracking_id
+
+    def build_tracking_urls(self, template: Dict[str, Any], tracking_id: str):
+        """Build the open/click/landing URLs for a tracking id"""
+        return {
+            "open": f"http://localhost:8000/track/open/{tracking_id}",
+            "click": f"http://localhost:8000/track/click/{tracking_id}",
+            "landing": f"http://localhost:8000/landing/{template['template_id']}/{tracking_id}",
+        }
+
+    async def send_campaign(
+        self,
+        campaign: Dict[str, Any],
+        targets: Iterable[Dict[str, Any]],
+        template: Dict[str, Any],
+        on_result: Optional[Callable] = None,
+    ) -> Dict[str, int]:
+        """Send a campaign to all targets and return sent/failed/retried counts.
+
+        ``on_result(target, success, tracking_id, error)`` is called once per
+        target after its final attempt. A target carrying a ``tracking_id``
+        keeps it instead of getting a new one.
+        """
+        progress = {"sent": 0, "failed": 0, "retried": 0}
+        tracker = self.telemetry.campaign(campaign["id"])
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency)
+
+        workers = [
+            asyncio.create_task(
+                self._worker(queue, campaign, template, progress, tracker, on_result)
+            )
+            for _ in range(self.concurrency)
+        ]
+
+        try:
+            # Bodies are rendered lazily and handed to the workers in
+            # provider-sized batches through a bounded queue, so only a few
+            # batches are in memory at a time
+            batch = []
+            for item in self._render(campaign, template, targets, tracker):
+                batch.append(item)
+                if len(batch) >= self.batch_size:
+                    await queue.put(batch)
+                    batch = []
+            if batch:
+                await queue.put(batch)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for worker in workers:
+                worker.cancel()
+            # Make sure every status of this campaign is written before returning
+            started = time.perf_counter()
+            if await self.status_writer.flush():
+                tracker.observe("db", time.perf_counter() - started)
+
+        return progress
+
+    def _render(
+        self,
+        campaign: Dict[str, Any],
+        template: Dict[str, Any],
+        targets: Iterable[Dict[str, Any]],
+        tracker,
+    ):
+        def recipients():
+            for target in targets:
+                tracking_id = target.get("tracking_id") or self.new_tracking_id(
+                    campaign, target
+                )
+                target = dict(target, tracking_id=tracking_id)
+                yield target, self.build_tracking_urls(template, tracking_id)
+
+        rendered = self.template_service.render_bulk(template, recipients())
+        while True:
+            started = time.perf_counter()
+            item = next(rendered, None)
+            if item is None:
+                return
+            tracker.observe("render", time.perf_counter() - started)
+            yield item
+
+    async def _worker(
+        self,
+        queue: asyncio.Queue,
+        campaign: Dict[str, Any],
+        template: Dict[str, Any],
+        progress: Dict[str, int],
+        tracker,
+        on_result: Optional[Callable],
+    ):
+        while True:
+            batch = await queue.get()
+            if batch is None:
+                return
+
+            try:
+                results = await self._send_batch(batch, progress, tracker)
+            except Exception as e:
+                logger.error(f"Error sending batch of {len(batch)} emails: {str(e)}")
+                results = []
+                for target, _ in batch:
+                    progress["failed"] += 1
+                    tracker.record_failed()
+                    self.status_writer.add(
+                        target["id"], "failed", metadata={"error": str(e)}
+                    )
+                    results.append((target, False, target.get("tracking_id"), str(e)))
+
+            if on_result:
+                for target, success, tracking_id, error in results:
+                    on_result(target, success, tracking_id, error)
+
+    async def _send_batch(
+        self,
+        batch: List[Tuple[Dict[str, Any], Dict[str, str]]],
+        progress: Dict[str, int],
+        tracker,
+    ) -> List[Tuple[Dict[str, Any], bool, str, Optional[str]]]:
+        """Send rendered targets as one provider request.
+
+        A request that fails as a whole is retried as the same batch under
+        the same idempotency key, so the provider delivers it only once even
+        if an earlier attempt got through. Messages the provider rejects
+        individually fail without a retry.
+        """
+        emails = [
+            {
+                "to_email": target["email"],
+                "subject": personalized_content["subject"],
+                "html_content": personalized_content["html"],
+                "tracking_id": target["tracking_id"],
+            }
+            for target, personalized_content in batch
+        ]
+        idempotency_key = batch_idempotency_key(email["tracking_id"] for email in emails)
+
+        message_ids: Optional[Dict[str, Optional[str]]] = None
+        error: Optional[str] = None
+        attempts = 0
+        for attempt in range(self.max_retries + 1):
+            if attempt > 0:
+                progress["retried"] += len(batch)
+                for _ in batch:
+                    tracker.record_retry()
+                await asyncio.sleep(self._retry_delay(attempt))
+
+            attempts += 1
+            status_code = None
+            retry_after = None
+            await self.rate_control.acquire()
+            started = time.monotonic()
+            try:
+                message_ids = await self.email_service.send_batch(emails, idempotency_key)
+                error = None
+            except EmailProviderError as e:
+                error = str(e)
+                status_code = e.status_code
+                retry_after = e.retry_after
+            except Exception as e:
+                error = str(e)
+            finally:
+                tracker.observe("send", time.monotonic() - started)
+                await self.rate_control.release(
+                    time.monotonic() - started,
+                    status_code=status_code,
+                    retry_after=retry_after,
+                    error=message_ids is None,
+                )
+
+            if message_ids is not None:
+                break
+
+            # Other client errors (bad request, validation) will not succeed on retry
+            if status_code is not None and 400 <= status_code < 500:
+                if status_code not in (408, 429):
+                    break
+
+        results = []
+        sent_at = datetime.utcnow().isoformat()
+        for target, _ in batch:
+            tracking_id = target["tracking_id"]
+            if message_ids is not None and message_ids.get(tracking_id):
+                progress["sent"] += 1
+                tracker.record_sent()
+                self.status_writer.add(
+                    target["id"],
+                    "sent",
+                    tracking_id=tracking_id,
+                    metadata={"sent_at": sent_at},
+                )
+                results.append((target, True, tracking_id, None))
+                continue
+
+            target_error = error if message_ids is None else "Rejected by email provider"
+            progress["failed"] += 1
+            tracker.record_failed()
+            self.status_writer.add(
+                target["id"],
+                "failed",
+                metadata={"error": target_error, "attempts": attempts},
+            )
+            results.append((target, False, tracking_id, target_error))
+        return results
+
+    def _retry_delay(self, attempt: int) -> float:
+        """Exponential backoff with full jitter"""
+        return random.uniform(0, self.retry_base_delay * (2 ** (attempt - 1)))
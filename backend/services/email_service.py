@@ -1,45 +1,73 @@
 import os
+import hashlib
 import logging
-import resend
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Iterable, List
 from datetime import datetime
 import asyncio
 
+from services.email_transport import (
+    EmailProviderError,
+    EmailTransport,
+    create_transport,
+)
+
 logger = logging.getLogger(__name__)
 
 
+def batch_idempotency_key(tracking_ids: Iterable[str]) -> str:
+    """Idempotency key of a batch, derived from its messages' tracking ids.
+
+    Queued jobs keep their tracking id across retries, so sending the same
+    batch again reuses the key and the provider delivers it only once.
+    """
+    digest = hashlib.sha256("\n".join(tracking_ids).encode("utf-8")).hexdigest()
+    return f"batch-{digest}"
+
+
 class EmailService:
-    def __init__(self):
+    def __init__(self, transport: Optional[EmailTransport] = None):
         self.api_key = os.getenv("RESEND_API_KEY")
         self.from_email = os.getenv("FROM_EMAIL")
+        self.batch_size = int(os.getenv("RESEND_BATCH_SIZE", 100))
+        self.batch_retries = int(os.getenv("RESEND_BATCH_RETRIES", 2))
+        self.transport = transport
         self.client = None
 
     async def initialize(self):
-        """Initialize Resend client"""
+        """Initialize the provider transport"""
         try:
-            if not self.api_key:
-                raise ValueError("RESEND_API_KEY environment variable must be set")
+            if self.transport is None:
+                self.transport = create_transport(self.api_key)
 
-            resend.api_key = self.api_key
-            self.client = resend
+            await self.transport.start()
+            self.client = self.transport
 
-            logger.info("Resend email service initialized successfully")
+            logger.info(
+                f"Email service initialized successfully ({self.transport.name} transport)"
+            )
         except Exception as e:
             logger.error(f"Failed to initialize email service: {str(e)}")
             raise
 
+    async def close(self):
+        """Close the provider transport and its connection pool"""
+        if self.transport:
+            await self.transport.close()
+        self.client = None
+
     async def health_check(self) -> Dict[str, Any]:
         """Check email service health"""
         try:
             if not self.client:
                 return {"status": "error", "message": "Email service not initialized"}
 
-            if not self.api_key:
+            if not self.api_key and self.transport.name == "resend":
                 return {"status": "error", "message": "API key not configured"}
 
             return {
                 "status": "healthy",
                 "message": "Email service ready",
+                "transport": self.transport.name,
                 "timestamp": datetime.utcnow().isoformat(),
             }
         except Exception as e:
@@ -56,34 +84,32 @@ class EmailService:
         html_content: str,
         tracking_id: str,
         from_name: str = "Security Team",
+        raise_errors: bool = False,
     ) -> bool:
-        """Send an email using Resend"""
+        """Send an email through the provider transport.
+
+        With ``raise_errors`` provider errors are raised as
+        EmailProviderError instead of returning False, so callers can react
+        to throttling.
+        """
         try:
             if not self.client:
                 logger.error("Email service not initialized")
                 return False
 
-            # Add tracking pixel to HTML content
-            tracking_pixel = f'<img src="http://localhost:8000/track/open/{tracking_id}" alt="" width="1" height="1" style="display:none;">'
-            html_with_tracking = html_content + tracking_pixel
-
-            # Prepare email data
-            email_data = {
-                "from": f"{from_name} <{self.from_email}>",
-                "to": [to_email],
-                "subject": subject,
-                "html": html_with_tracking,
-                "tags": [
-                    {"name": "category", "value": "phishing-simulation"},
-                    {"name": "tracking_id", "value": tracking_id},
-                ],
-            }
+            email_data = self._build_email_data(
+                to_email, subject, html_content, tracking_id, from_name
+            )
 
             # Send email
-            response = resend.Emails.send(email_data)
+            # The tracking id doubles as the idempotency key so a retried job
+            # is not delivered twice
+            response = await self.transport.send(email_data, idempotency_key=tracking_id)
 
-            if response and hasattr(response, "id"):
-                logger.info(f"Email sent successfully to {to_email}, ID: {response.id}")
+            if response and response.get("id"):
+                logger.info(
+                    f"Email sent successfully to {to_email}, ID: {response['id']}"
+                )
                 return True
             else:
                 logger.error(
@@ -91,15 +117,127 @@ class EmailService:
                 )
                 return True
 
+        except EmailProviderError as e:
+            logger.error(f"Error sending email to {to_email}: {str(e)}")
+            if raise_errors:
+                raise
+            return False
         except Exception as e:
             logger.error(f"Error sending email to {to_email}: {str(e)}")
             return False
 
+    def _build_email_data(
+        self,
+        to_email: str,
+        subject: str,
+        html_content: str,
+        tracking_id: str,
+        from_name: str = "Security Team",
+    ) -> Dict[str, Any]:
+        """Build the Resend payload for one message, including the tracking pixel"""
+        # Add tracking pixel to HTML content
+        tracking_pixel = f'<img src="http://localhost:8000/track/open/{tracking_id}" alt="" width="1" height="1" style="display:none;">'
+        html_with_tracking = html_content + tracking_pixel
+
+        return {
+            "from": f"{from_name} <{self.from_email}>",
+            "to": [to_email],
+            "subject": subject,
+            "html": html_with_tracking,
+            "tags": [
+                {"name": "category", "value": "phishing-simulation"},
+                {"name": "tracking_id", "value": tracking_id},
+            ],
+        }
+
+    async def send_batch(
+        self, email_list: List[Dict[str, Any]], idempotency_key: Optional[str] = None
+    ) -> Dict[str, Optional[str]]:
+        """Send up to batch_size emails in one request.
+
+        Returns a map of tracking_id to provider message id; rejected
+        messages map to None. Provider errors for the whole batch raise
+        EmailProviderError.
+        """
+        if not self.client:
+            logger.error("Email service not initialized")
+            return {email["tracking_id"]: None for email in email_list}
+
+        payload = [
+            self._build_email_data(
+                to_email=email["to_email"],
+                subject=email["subject"],
+                html_content=email["html_content"],
+                tracking_id=email["tracking_id"],
+                from_name=email.get("from_name", "Security Team"),
+            )
+            for email in email_list
+        ]
+
+        response = await self.transport.send_batch(
+            payload, idempotency_key=idempotency_key
+        )
+
+        if isinstance(response, dict):
+            data = response.get("data") or []
+            errors = response.get("errors") or []
+        else:
+            data, errors = response or [], []
+        rejected = {error.get("index") for error in errors}
+
+        # Results come back in request order
+        message_ids: Dict[str, Optional[str]] = {}
+        for index, email in enumerate(email_list):
+            message_id = None
+            if index not in rejected and index < len(data) and data[index]:
+                message_id = data[index].get("id")
+            message_ids[email["tracking_id"]] = message_id
+
+        return message_ids
+
     async def send_bulk_emails(
-        self, email_list: list, delay_seconds: float = 0.1
-    ) -> Dict[str, int]:
-        """Send bulk emails with rate limiting"""
-        results = {"sent": 0, "failed": 0}
+        self, email_list: list, delay_seconds: float = 0.1, use_batch: bool = True
+    ) -> Dict[str, Any]:
+        """Send bulk emails in provider-sized batches with rate limiting.
+
+        A batch that fails as a whole is retried as the same batch under the
+        same idempotency key, so a request that reached the provider before
+        failing is not delivered twice. Messages the provider rejects are
+        counted as failed.
+        """
+        results = {"sent": 0, "failed": 0, "requests": 0, "message_ids": {}}
+
+        if use_batch and self.batch_size > 1:
+            for start in range(0, len(email_list), self.batch_size):
+                batch = email_list[start : start + self.batch_size]
+                idempotency_key = batch_idempotency_key(
+                    email["tracking_id"] for email in batch
+                )
+                message_ids: Dict[str, Optional[str]] = {}
+                for attempt in range(self.batch_retries + 1):
+                    if attempt > 0:
+                        await asyncio.sleep(max(delay_seconds, 0.1) * 2 ** attempt)
+                    try:
+                        results["requests"] += 1
+                        message_ids = await self.send_batch(batch, idempotency_key)
+                        break
+                    except Exception as e:
+                        logger.error(
+                            f"Batch send failed (attempt {attempt + 1}): {str(e)}"
+                        )
+
+                for email_data in batch:
+                    message_id = message_ids.get(email_data["tracking_id"])
+                    if message_id:
+                        results["sent"] += 1
+                        results["message_ids"][email_data["tracking_id"]] = message_id
+                    else:
+                        results["failed"] += 1
+
+                if delay_seconds > 0:
+                    await asyncio.sleep(delay_seconds)
+
+            return results
 
         for email_data in email_list:
             try:
@@ -111,6 +249,7 @@ class EmailService:
                     from_name=email_data.get("from_name", "Security Team"),
                 )
 
+                results["requests"] += 1
                 if success:
                     results["sent"] += 1
                 else:
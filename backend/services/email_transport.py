@@ -0,0 +1,263 @@
+import os
+import abc
+import asyncio
+import logging
+import itertools
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Dict, Any, List, Optional
+
+import httpx
+
+try:
+    import h2  # noqa: F401
+
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+class EmailProviderError(Exception):
+    """Error response from the email provider"""
+
+    def __init__(
+        self,
+        message: str,
+        status_code: Optional[int] = None,
+        retry_after: Optional[float] = None,
+    ):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Parse a Retry-After header given in seconds or as an HTTP date"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class EmailTransport(abc.ABC):
+    """Interface between EmailService and an email provider.
+
+    ``send`` and ``send_batch`` take Resend-shaped payloads and return the
+    provider's JSON response, raising EmailProviderError on failure.
+    """
+
+    name = "base"
+
+    async def start(self):
+        pass
+
+    async def close(self):
+        pass
+
+    @abc.abstractmethod
+    async def send(
+        self, email_data: Dict[str, Any], idempotency_key: Optional[str] = None
+    ) -> Dict[str, Any]:
+        ...
+
+    @abc.abstractmethod
+    async def send_batch(
+        self, payload: List[Dict[str, Any]], idempotency_key: Optional[str] = None
+    ) -> Dict[str, Any]:
+        ...
+
+
+class ResendHTTPTransport(EmailTransport):
+    """Resend API over a shared keep-alive httpx connection pool"""
+
+    name = "resend"
+
+    def __init__(self, api_key: str, base_url: Optional[str] = None):
+        self.api_key = api_key
+        self.base_url = (base_url or "https://api.resend.com").rstrip("/")
+        self.max_connections = int(os.getenv("EMAIL_HTTP_MAX_CONNECTIONS", 20))
+        self.max_keepalive = int(os.getenv("EMAIL_HTTP_MAX_KEEPALIVE", 20))
+        self.keepalive_expiry = float(os.getenv("EMAIL_HTTP_KEEPALIVE_EXPIRY", 30))
+        self.timeout = float(os.getenv("EMAIL_HTTP_TIMEOUT", 10))
+        self.connect_timeout = float(os.getenv("EMAIL_HTTP_CONNECT_TIMEOUT", 5))
+        self.max_in_flight = int(os.getenv("EMAIL_HTTP_MAX_IN_FLIGHT", 20))
+        self.client: Optional[httpx.AsyncClient] = None
+        self._semaphore = asyncio.Semaphore(self.max_in_flight)
+
+    async def start(self):
+        self.client = httpx.AsyncClient(
+            base_url=self.base_url,
+            http2=HTTP2_AVAILABLE,
+            headers={
+                "Accept": "application/json",
+                "Authorization": f"Bearer {self.api_key}",
+            },
+            limits=httpx.Limits(
+                max_connections=self.max_connections,
+                max_keepalive_connections=self.max_keepalive,
+                keepalive_expiry=self.keepalive_expiry,
+            ),
+            timeout=httpx.Timeout(self.timeout, connect=self.connect_timeout),
+        )
+        logger.info(
+            f"Resend transport started (http2={HTTP2_AVAILABLE}, "
+            f"max_connections={self.max_connections})"
+        )
+
+    async def close(self):
+        if self.client:
+            await self.client.aclose()
+            self.client = None
+
+    async def _post(
+        self,
+        path: str,
+        payload: Any,
+        idempotency_key: Optional[str] = None,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Dict[str, Any]:
+        if not self.client:
+            raise EmailProviderError("Transport not started")
+
+        headers = dict(headers or {})
+        if idempotency_key:
+            headers["Idempotency-Key"] = idempotency_key
+        async with self._semaphore:
+            try:
+                response = await self.client.post(path, json=payload, headers=headers)
+            except httpx.HTTPError as e:
+                raise EmailProviderError(f"{type(e).__name__}: {str(e)}")
+
+        if response.status_code >= 400:
+            try:
+                message = response.json().get("message", response.text)
+            except ValueError:
+                message = response.text
+            raise EmailProviderError(
+                message or f"HTTP {response.status_code}",
+                status_code=response.status_code,
+                retry_after=_parse_retry_after(response.headers.get("retry-after")),
+            )
+
+        return response.json() if response.content else {}
+
+    async def send(
+        self, email_data: Dict[str, Any], idempotency_key: Optional[str] = None
+    ) -> Dict[str, Any]:
+        return await self._post("/emails", email_data, idempotency_key)
+
+    async def send_batch(
+        self, payload: List[Dict[str, Any]], idempotency_key: Optional[str] = None
+    ) -> Dict[str, Any]:
+        # Permissive validation reports invalid messages per index instead of
+        # rejecting the whole batch
+        return await self._post(
+            "/emails/batch",
+            payload,
+            idempotency_key,
+            headers={"x-batch-validation": "permissive"},
+        )
+
+
+class StubEmailTransport(EmailTransport):
+    """In-process transport for local load tests.
+
+    Accepts every message after ``latency`` (+/- ``latency_jitter``)
+    seconds, except that ``error_rate`` of requests fail with a 500,
+    ``throttle_rate`` of them get a 429, and requests beyond ``rate_limit``
+    per second are throttled the way the real provider would.
+    """
+
+    name = "stub"
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        latency_jitter: float = 0.0,
+        error_rate: float = 0.0,
+        throttle_rate: float = 0.0,
+        rate_limit: Optional[float] = None,
+        retry_after: float = 1.0,
+    ):
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.sent = 0
+        self.requests = 0
+        self.errors = 0
+        self.throttled = 0
+        self._ids = itertools.count(1)
+        self._window_start = 0
+        self._window_requests = 0
+
+    async def _round_trip(self):
+        self.requests += 1
+        latency = self.latency
+        if self.latency_jitter:
+            latency = max(0.0, latency + random.uniform(-1, 1) * self.latency_jitter)
+        if latency > 0:
+            await asyncio.sleep(latency)
+
+        if self.rate_limit:
+            second = int(time.monotonic())
+            if second != self._window_start:
+                self._window_start, self._window_requests = second, 0
+            self._window_requests += 1
+            if self._window_requests > self.rate_limit:
+                self.throttled += 1
+                raise EmailProviderError(
+                    "Too many requests", status_code=429, retry_after=self.retry_after
+                )
+
+        roll = random.random()
+        if roll < self.throttle_rate:
+            self.throttled += 1
+            raise EmailProviderError(
+                "Too many requests", status_code=429, retry_after=self.retry_after
+            )
+        if roll < self.throttle_rate + self.error_rate:
+            self.errors += 1
+            raise EmailProviderError("Internal server error", status_code=500)
+
+    async def send(
+        self, email_data: Dict[str, Any], idempotency_key: Optional[str] = None
+    ) -> Dict[str, Any]:
+        await self._round_trip()
+        self.sent += 1
+        return {"id": f"stub-{next(self._ids)}"}
+
+    async def send_batch(
+        self, payload: List[Dict[str, Any]], idempotency_key: Optional[str] = None
+    ) -> Dict[str, Any]:
+        await self._round_trip()
+        self.sent += len(payload)
+        return {"data": [{"id": f"stub-{next(self._ids)}"} for _ in payload]}
+
+
+def create_transport(api_key: Optional[str]) -> EmailTransport:
+    """Build the transport selected by EMAIL_TRANSPORT (resend or stub)"""
+    kind = os.getenv("EMAIL_TRANSPORT", "resend").lower()
+    if kind == "stub":
+        rate_limit = os.getenv("EMAIL_STUB_RATE_LIMIT")
+        return StubEmailTransport(
+            latency=float(os.getenv("EMAIL_STUB_LATENCY", 0)),
+            latency_jitter=float(os.getenv("EMAIL_STUB_LATENCY_JITTER", 0)),
+            error_rate=float(os.getenv("EMAIL_STUB_ERROR_RATE", 0)),
+            throttle_rate=float(os.getenv("EMAIL_STUB_THROTTLE_RATE", 0)),
+            rate_limit=float(rate_limit) if rate_limit else None,
+        )
+    if not api_key:
+        raise ValueError("RESEND_API_KEY environment variable must be set")
+    return ResendHTTPTransport(api_key, base_url=os.getenv("RESEND_API_URL"))
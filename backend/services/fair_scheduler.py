@@ -0,0 +1,88 @@
+from typing import Any, Dict, List
+
+from services.send_telemetry import SlidingWindowCounter
+
+
+class FairScheduler:
+    """Deficit round robin over the campaigns that have due send jobs.
+
+    Each round adds ``quantum * priority`` to every backlogged campaign's
+    deficit, and a campaign may take as many jobs as its whole deficit.
+    Over time every campaign gets a share of the sends proportional to its
+    priority, however large the other campaigns are. Rate caps are not
+    enforced here but by the send queue, which every worker shares; the
+    ``due`` counts it reports already respect them.
+    """
+
+    def __init__(self, quantum: float = 1.0, window_seconds: int = 60):
+        self.quantum = quantum
+        self.window_seconds = window_seconds
+        self._deficits: Dict[str, float] = {}
+        self._order: List[str] = []
+        self._sent: Dict[str, SlidingWindowCounter] = {}
+
+    def allocate(self, demand: Dict[str, Dict[str, Any]], limit: int) -> Dict[str, int]:
+        """Split ``limit`` job leases across campaigns.
+
+        ``demand`` maps a campaign id to its ``due`` job count and
+        ``priority``. Returns the number of jobs to lease per campaign.
+        """
+        # Campaigns without due jobs leave the round and lose their deficit
+        for campaign_id in list(self._deficits):
+            if not demand.get(campaign_id, {}).get("due"):
+                del self._deficits[campaign_id]
+        self._order = [c for c in self._order if c in self._deficits]
+        for campaign_id, entry in demand.items():
+            if entry["due"] and campaign_id not in self._deficits:
+                self._deficits[campaign_id] = 0.0
+                self._order.append(campaign_id)
+
+        wants = {campaign_id: demand[campaign_id]["due"] for campaign_id in self._order}
+
+        allocation = {campaign_id: 0 for campaign_id in self._order}
+        remaining = limit
+        while remaining > 0:
+            progressed = False
+            for campaign_id in self._order:
+                if remaining <= 0:
+                    break
+                if allocation[campaign_id] >= wants[campaign_id]:
+                    continue
+                self._deficits[campaign_id] += self.quantum * max(
+                    1, demand[campaign_id].get("priority") or 1
+                )
+                take = min(
+                    int(self._deficits[campaign_id]),
+                    wants[campaign_id] - allocation[campaign_id],
+                    remaining,
+                )
+                if take > 0:
+                    allocation[campaign_id] += take
+                    self._deficits[campaign_id] -= take
+                    remaining -= take
+                    progressed = True
+            if not progressed:
+                break
+
+        # Start the next allocation with the next campaign so rounding
+        # leftovers do not always favor the same one
+        if self._order:
+            self._order.append(self._order.pop(0))
+
+        return {c: n for c, n in allocation.items() if n}
+
+    def record(self, campaign_id: str, sent: int):
+        """Count jobs of a campaign that were sent, for throughput reporting"""
+        counter = self._sent.get(campaign_id)
+        if counter is None:
+            counter = self._sent[campaign_id] = SlidingWindowCounter(self.window_seconds)
+        counter.add(sent)
+
+    def throughput(self, campaign_id: str) -> float:
+        """Sends per second of a campaign over the reporting window"""
+        counter = self._sent.get(campaign_id)
+        return counter.rate() if counter else 0.0
+
+    def forget(self, campaign_id: str):
+        """Drop the throughput history of a finished campaign"""
+        self._sent.pop(campaign_id, None)
@@ -0,0 +1,219 @@
+import gzip
+import time
+import zlib
+import struct
+import hashlib
+import logging
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Dict, List, Optional, Set
+
+from fastapi import Request, Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+_TRACKING_SENTINEL = "\x00tracking_id\x00"
+_GZIP_HEADER = b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff"
+
+
+def _deflate_segment(data: bytes, final: bool) -> bytes:
+    """Raw-deflate a segment so it can be concatenated with other segments.
+
+    Non-final segments end with a full flush (byte aligned, no references
+    to earlier data), so independently compressed segments join into one
+    valid deflate stream as long as only the last one is final.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush(
+        zlib.Z_FINISH if final else zlib.Z_FULL_FLUSH
+    )
+
+
+def _accepted_encodings(accept_encoding: str) -> Set[str]:
+    encodings = set()
+    for part in accept_encoding.split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name and quality > 0:
+            encodings.add(name.strip().lower())
+    return encodings
+
+
+class StaticPage:
+    """A fully rendered page with precompressed gzip and brotli variants"""
+
+    def __init__(self, html: str, last_modified: float):
+        self.body = html.encode("utf-8")
+        self.variants: Dict[str, bytes] = {
+            "gzip": gzip.compress(self.body, compresslevel=9, mtime=0)
+        }
+        if brotli is not None:
+            self.variants["br"] = brotli.compress(self.body)
+        self.etag = f'"{hashlib.sha1(self.body).hexdigest()[:20]}"'
+        self.last_modified = last_modified
+
+
+class LandingPage:
+    """A landing page split around its tracking id.
+
+    The static fragments are encoded and deflated once; a request only
+    substitutes and deflates the tracking id itself.
+    """
+
+    def __init__(self, fragments: List[str], version: str, last_modified: float):
+        self.version = version
+        self.last_modified = last_modified
+        self.fragments = [f.encode("utf-8") for f in fragments]
+        self.deflated = [_deflate_segment(f, final=False) for f in self.fragments]
+        self.deflated[-1] = _deflate_segment(self.fragments[-1], final=True)
+
+    def etag(self, tracking_id: str) -> str:
+        return f'"{self.version}-{tracking_id}"'
+
+    def body(self, tracking_id: str) -> bytes:
+        return tracking_id.encode("utf-8").join(self.fragments)
+
+    def gzip_body(self, tracking_id: str) -> bytes:
+        token = tracking_id.encode("utf-8")
+        token_deflated = _deflate_segment(token, final=False)
+
+        parts = [_GZIP_HEADER]
+        crc = 0
+        size = 0
+        for index, fragment in enumerate(self.fragments):
+            if index:
+                parts.append(token_deflated)
+                crc = zlib.crc32(token, crc)
+                size += len(token)
+            parts.append(self.deflated[index])
+            crc = zlib.crc32(fragment, crc)
+            size += len(fragment)
+        parts.append(struct.pack("<II", crc, size & 0xFFFFFFFF))
+        return b"".join(parts)
+
+
+class PageCache:
+    """Compiled landing pages and pre-rendered static pages served with
+    precompressed variants, ETag and Last-Modified"""
+
+    def __init__(self, template_service):
+        self.template_service = template_service
+        self.loaded_at = time.time()
+        self._landing: Dict[str, LandingPage] = {}
+        self._static: Dict[str, StaticPage] = {}
+
+    def landing_page(self, template_id: str) -> Optional[LandingPage]:
+        """Return the split landing page for a template, building it on first use.
+
+        Returns None for unknown templates and for templates that cannot be
+        split around the tracking id.
+        """
+        if template_id in self._landing:
+            return self._landing[template_id]
+
+        template = self.template_service.get_landing_template(template_id)
+        if template is None:
+            return None
+
+        fragments = template.render(
+            template_id=template_id, tracking_id=_TRACKING_SENTINEL
+        ).split(_TRACKING_SENTINEL)
+        sample = "sample-tracking-id"
+        if sample.join(fragments) != template.render(
+            template_id=template_id, tracking_id=sample
+        ):
+            logger.warning(
+                f"Landing template {template_id} transforms tracking_id; not cached"
+            )
+            return None
+
+        version = template.name.rsplit("/", 1)[-1]
+        page = LandingPage(fragments, version, self.loaded_at)
+        self._landing[template_id] = page
+        return page
+
+    def static_page(self, name: str, render) -> StaticPage:
+        """Return a pre-rendered static page, rendering it with ``render`` once"""
+        page = self._static.get(name)
+        if page is None:
+            page = StaticPage(render(), self.loaded_at)
+            self._static[name] = page
+        return page
+
+    def _not_modified(self, request: Request, etag: str, last_modified: float) -> bool:
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            tags = [t.strip() for t in if_none_match.split(",")]
+            return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since:
+            try:
+                since = parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+            return int(last_modified) <= since
+        return False
+
+    def _respond(
+        self,
+        request: Request,
+        etag: str,
+        last_modified: float,
+        cache_control: str,
+        identity,
+        variants: Dict[str, object],
+    ) -> Response:
+        headers = {
+            "ETag": etag,
+            "Last-Modified": formatdate(last_modified, usegmt=True),
+            "Cache-Control": cache_control,
+            "Vary": "Accept-Encoding",
+        }
+        if self._not_modified(request, etag, last_modified):
+            return Response(status_code=304, headers=headers)
+
+        accepted = _accepted_encodings(request.headers.get("accept-encoding", ""))
+        for encoding in ("br", "gzip"):
+            variant = variants.get(encoding)
+            if variant is not None and encoding in accepted:
+                headers["Content-Encoding"] = encoding
+                body = variant() if callable(variant) else variant
+                return Response(content=body, media_type="text/html", headers=headers)
+
+        body = identity() if callable(identity) else identity
+        return Response(content=body, media_type="text/html", headers=headers)
+
+    def landing_response(
+        self, request: Request, page: LandingPage, tracking_id: str
+    ) -> Response:
+        # Revalidated on every visit so each one still reaches the server
+        return self._respond(
+            request,
+            page.etag(tracking_id),
+            page.last_modified,
+            "private, no-cache",
+            lambda: page.body(tracking_id),
+            {"gzip": lambda: page.gzip_body(tracking_id)},
+        )
+
+    def static_response(self, request: Request, page: StaticPage) -> Response:
+        return self._respond(
+            request,
+            page.etag,
+            page.last_modified,
+            "public, max-age=300",
+            page.body,
+            page.variants,
+        )
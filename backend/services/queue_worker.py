@@ -0,0 +1,266 @@
+import os
+import asyncio
+import logging
+import socket
+import uuid
+from typing import Dict, Any, List
+
+from services.fair_scheduler import FairScheduler
+
+logger = logging.getLogger(__name__)
+
+
+class SendQueueWorker:
+    """Leases jobs from the SendQueue and sends them with the CampaignSender"""
+
+    def __init__(self, send_queue, campaign_sender, template_service, supabase_client):
+        self.send_queue = send_queue
+        self.campaign_sender = campaign_sender
+        self.template_service = template_service
+        self.supabase_client = supabase_client
+
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        # Enough for a full batch per sender worker
+        self.lease_size = int(
+            os.getenv(
+                "SEND_QUEUE_LEASE_SIZE",
+                campaign_sender.concurrency * campaign_sender.batch_size,
+            )
+        )
+        self.poll_interval = float(os.getenv("SEND_QUEUE_POLL_INTERVAL", 1.0))
+        self.retry_delay = float(os.getenv("SEND_QUEUE_RETRY_DELAY", 60))
+        self.scheduler = FairScheduler()
+        self._stopping = asyncio.Event()
+        self._wakeup = asyncio.Event()
+        # In-flight slice of each campaign and its job count
+        self._slices: Dict[str, asyncio.Task] = {}
+        self._in_flight: Dict[str, int] = {}
+
+    def stop(self):
+        self._stopping.set()
+        self._wakeup.set()
+
+    async def run(self):
+        """Lease and send jobs until stopped.
+
+        Each campaign's leased slice is sent as its own task, and the next
+        lease is taken as soon as there is room, so a slow campaign only
+        holds up itself. A campaign gets a new slice once its previous one
+        is settled, and at most ``lease_size`` jobs are in flight. Queue
+        calls run in threads, since SQLite blocks while another worker holds
+        the write lock.
+        """
+        logger.info(f"Send queue worker {self.worker_id} started")
+        while not self._stopping.is_set():
+            self._wakeup.clear()
+            try:
+                if await self.lease_more():
+                    continue
+            except Exception as e:
+                logger.error(f"Error in send queue worker: {str(e)}")
+
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+        if self._slices:
+            await asyncio.gather(*self._slices.values(), return_exceptions=True)
+        logger.info(f"Send queue worker {self.worker_id} stopped")
+
+    async def lease_more(self) -> int:
+        """Lease slices for the idle campaigns and start sending them;
+        returns the number of jobs leased"""
+        room = self.lease_size - sum(self._in_flight.values())
+        if room <= 0:
+            return 0
+
+        # Share each lease between the running campaigns so a large
+        # campaign cannot starve the others
+        demand = {
+            campaign_id: entry
+            for campaign_id, entry in (
+                await asyncio.to_thread(self.send_queue.demand, room)
+            ).items()
+            if campaign_id not in self._slices
+        }
+        allocation = self.scheduler.allocate(demand, room)
+        jobs = (
+            await asyncio.to_thread(self.send_queue.lease, self.worker_id, room, allocation)
+            if allocation
+            else []
+        )
+
+        by_campaign: Dict[str, List[Dict[str, Any]]] = {}
+        for job in jobs:
+            by_campaign.setdefault(job["campaign_id"], []).append(job)
+        for campaign_id, campaign_jobs in by_campaign.items():
+            self._in_flight[campaign_id] = len(campaign_jobs)
+            task = asyncio.create_task(self.process_campaign(campaign_jobs))
+            self._slices[campaign_id] = task
+            task.add_done_callback(
+                lambda task, campaign_id=campaign_id: self._slice_done(campaign_id, task)
+            )
+        return len(jobs)
+
+    def _slice_done(self, campaign_id: str, task: asyncio.Task):
+        self._slices.pop(campaign_id, None)
+        self._in_flight.pop(campaign_id, None)
+        if not task.cancelled() and task.exception():
+            logger.error(
+                f"Error sending jobs of campaign {campaign_id}: {str(task.exception())}"
+            )
+        self._wakeup.set()
+
+    async def process_campaign(self, campaign_jobs: List[Dict[str, Any]]):
+        """Send the leased jobs of one campaign and settle them"""
+        campaign = campaign_jobs[0]["campaign"]
+        template = self.template_service.get_template(campaign_jobs[0]["template_id"])
+        jobs_by_target = {job["target"]["id"]: job for job in campaign_jobs}
+
+        if not template:
+            await asyncio.to_thread(
+                self.send_queue.fail_many,
+                [(job, "Email template not found") for job in campaign_jobs],
+                self.worker_id,
+            )
+            return
+
+        if self.campaign_sender.telemetry.get(campaign["id"]) is None:
+            # First batch seen by this process, e.g. after a restart
+            counts = await asyncio.to_thread(self.send_queue.campaign_counts, campaign["id"])
+            self.campaign_sender.telemetry.start(
+                campaign["id"],
+                total=sum(counts.values()),
+                completed=counts["sent"] + counts["failed"],
+            )
+
+        results = []
+
+        def on_result(target, success, tracking_id, error):
+            results.append((jobs_by_target[target["id"]], success, error))
+
+        progress = await self.campaign_sender.send_campaign(
+            campaign,
+            [job["target"] for job in campaign_jobs],
+            template,
+            on_result=on_result,
+        )
+        self.scheduler.record(str(campaign["id"]), progress["sent"])
+
+        # send_campaign has flushed the target statuses by now, so jobs
+        # are only settled once the database reflects them. Jobs whose status
+        # did not persist stay leased and are picked up again when the lease
+        # expires.
+        unwritten = self.campaign_sender.status_writer.unwritten(jobs_by_target)
+        if unwritten:
+            logger.warning(
+                f"Leaving {len(unwritten)} jobs of campaign {campaign['id']} leased; "
+                f"their target status was not written"
+            )
+        settled = [result for result in results if result[0]["target"]["id"] not in unwritten]
+        completed = await asyncio.to_thread(
+            self.send_queue.complete_many,
+            [job for job, success, _ in settled if success],
+            self.worker_id,
+        )
+        released = await asyncio.to_thread(
+            self.send_queue.fail_many,
+            [(job, error) for job, success, error in settled if not success],
+            self.worker_id,
+            self.retry_delay,
+        )
+        # Only the last attempt leaves the target failed
+        failed = sum(
+            1 for job in released if job["attempts"] >= self.send_queue.max_attempts
+        )
+        counters = self.campaign_sender.counters
+        counters.add(campaign["id"], "total_sent", len(completed))
+        counters.add(campaign["id"], "total_failed", failed)
+
+        await self.finish_campaign_if_done(campaign)
+
+    def campaign_metrics(self) -> List[Dict[str, Any]]:
+        """Priority, rate cap, queue depth and throughput of running campaigns"""
+        return [
+            dict(
+                campaign,
+                throughput=round(self.scheduler.throughput(campaign["campaign_id"]), 3),
+            )
+            for campaign in self.send_queue.running_campaigns()
+        ]
+
+    async def enqueue_campaign_targets(
+        self, campaign: Dict[str, Any], start_at: float, window_seconds: float, spread: str
+    ) -> bool:
+        """Stream a campaign's pending targets into the send queue.
+
+        Without a send window every job is due at ``start_at``. With one, jobs
+        are held until the last page is queued and then spread over the window.
+        Relaunching a campaign only adds targets that are not queued yet.
+
+        If loading fails the campaign stays loading, with the error recorded
+        for its progress, so it is not completed with only part of its
+        targets; a relaunch or ``resume_loading`` picks it up again.
+        Returns True once every target is queued.
+        """
+        hold_until = start_at + window_seconds
+        queued = 0
+        try:
+            async for page in self.supabase_client.iter_campaign_target_pages(
+                campaign["id"]
+            ):
+                queued += await asyncio.to_thread(
+                    self.send_queue.enqueue_targets,
+                    campaign,
+                    page,
+                    self.campaign_sender.new_tracking_id,
+                    hold_until,
+                )
+            if window_seconds > 0:
+                await asyncio.to_thread(
+                    self.send_queue.schedule_campaign,
+                    campaign["id"],
+                    start_at,
+                    window_seconds,
+                    spread,
+                )
+        except Exception as e:
+            logger.error(f"Error queueing targets for campaign {campaign['name']}: {str(e)}")
+            await asyncio.to_thread(self.send_queue.loading_failed, campaign["id"], str(e))
+            return False
+
+        logger.info(f"Queued {queued} send jobs for campaign {campaign['name']}")
+        # Let the campaign complete; workers may already have sent every job
+        await asyncio.to_thread(self.send_queue.finish_loading, campaign["id"])
+        await self.finish_campaign_if_done(campaign)
+        return True
+
+    async def resume_loading(self) -> int:
+        """Finish loading the campaigns left loading by a failed or
+        interrupted launch; returns how many were fully loaded"""
+        loading = await asyncio.to_thread(self.send_queue.loading_campaigns)
+        resumed = 0
+        for plan in loading:
+            campaign = plan["campaign"]
+            logger.info(f"Resuming loading of campaign {campaign['name']}")
+            if await self.enqueue_campaign_targets(
+                campaign, plan["start_at"], plan["window_seconds"], plan["spread"]
+            ):
+                resumed += 1
+        return resumed
+
+    async def finish_campaign_if_done(self, campaign: Dict[str, Any]):
+        """Write final campaign stats once the last job of a campaign is done"""
+        if not await asyncio.to_thread(self.send_queue.finish_campaign, campaign["id"]):
+            return
+        self.scheduler.forget(str(campaign["id"]))
+        self.campaign_sender.telemetry.finish(campaign["id"])
+
+        # Settle the incremental counters with an exact recount
+        counts = await asyncio.to_thread(self.send_queue.campaign_counts, campaign["id"])
+        await self.campaign_sender.counters.reconcile(campaign["id"])
+        logger.info(
+            f"Campaign {campaign['name']} completed. Sent: {counts['sent']}, "
+            f"Failed: {counts['failed']}"
+        )
@@ -0,0 +1,661 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from typing import Dict, Any, List, Iterable, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class SendQueue:
+    """Durable per-target send jobs in an embedded SQLite (WAL) database.
+
+    Workers lease jobs for a visibility timeout; a job whose lease expires
+    before it is completed becomes available to other workers again. Jobs
+    are keyed by (campaign_id, target_id) and carry a fixed tracking id, so
+    re-enqueueing a campaign or retrying a job never creates duplicates.
+    """
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path or os.getenv("SEND_QUEUE_DB", "send_queue.db")
+        self.visibility_timeout = float(os.getenv("SEND_QUEUE_VISIBILITY_TIMEOUT", 300))
+        self.max_attempts = int(os.getenv("SEND_QUEUE_MAX_ATTEMPTS", 3))
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+
+    def initialize(self):
+        """Open the database and create the queue tables"""
+        self._conn = sqlite3.connect(
+            self.db_path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS send_campaigns (
+                campaign_id TEXT PRIMARY KEY,
+                campaign TEXT NOT NULL,
+                template_id INTEGER NOT NULL,
+                status TEXT NOT NULL DEFAULT 'active',
+                priority INTEGER NOT NULL DEFAULT 1,
+                max_rate REAL,
+                next_eligible_at REAL,
+                start_at REAL,
+                window_seconds REAL NOT NULL DEFAULT 0,
+                spread TEXT NOT NULL DEFAULT 'even',
+                load_error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+
+            CREATE TABLE IF NOT EXISTS send_jobs (
+                campaign_id TEXT NOT NULL,
+                target_id TEXT NOT NULL,
+                tracking_id TEXT NOT NULL,
+                target TEXT NOT NULL,
+                status TEXT NOT NULL DEFAULT 'pending',
+                attempts INTEGER NOT NULL DEFAULT 0,
+                available_at REAL NOT NULL,
+                lease_owner TEXT,
+                lease_expires_at REAL,
+                last_error TEXT,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (campaign_id, target_id)
+            );
+
+            CREATE INDEX IF NOT EXISTS idx_send_jobs_ready
+                ON send_jobs(status, available_at);
+            CREATE INDEX IF NOT EXISTS idx_send_jobs_lease
+                ON send_jobs(status, lease_expires_at);
+            CREATE INDEX IF NOT EXISTS idx_send_jobs_campaign_ready
+                ON send_jobs(campaign_id, status, available_at);
+            """
+        )
+        # Queues created before campaigns had a priority, rate cap and load plan
+        columns = {
+            row["name"] for row in self._conn.execute("PRAGMA table_info(send_campaigns)")
+        }
+        if "priority" not in columns:
+            self._conn.execute(
+                "ALTER TABLE send_campaigns ADD COLUMN priority INTEGER NOT NULL DEFAULT 1"
+            )
+        if "max_rate" not in columns:
+            self._conn.execute("ALTER TABLE send_campaigns ADD COLUMN max_rate REAL")
+        if "next_eligible_at" not in columns:
+            self._conn.execute("ALTER TABLE send_campaigns ADD COLUMN next_eligible_at REAL")
+        if "start_at" not in columns:
+            self._conn.executescript(
+                """
+                ALTER TABLE send_campaigns ADD COLUMN start_at REAL;
+                ALTER TABLE send_campaigns
+                    ADD COLUMN window_seconds REAL NOT NULL DEFAULT 0;
+                ALTER TABLE send_campaigns ADD COLUMN spread TEXT NOT NULL DEFAULT 'even';
+                ALTER TABLE send_campaigns ADD COLUMN load_error TEXT;
+                """
+            )
+        logger.info(f"Send queue opened at {self.db_path}")
+
+    def close(self):
+        if self._conn:
+            self._conn.close()
+            self._conn = None
+
+    @staticmethod
+    def _rate_allowance(
+        max_rate: Optional[float], next_eligible_at: Optional[float], now: float
+    ) -> Optional[int]:
+        """Jobs a rate-capped campaign may lease at ``now``; None if uncapped.
+
+        ``next_eligible_at`` is when the campaign's next job would be due at
+        exactly ``max_rate``; a campaign may run up to a second's worth of
+        jobs ahead of it.
+        """
+        if not max_rate:
+            return None
+        burst = max(1.0, max_rate) / max_rate
+        start = max(next_eligible_at or 0.0, now)
+        return max(0, int((now + burst - start) * max_rate + 1e-9))
+
+    def _transaction(self, fn):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._conn)
+                self._conn.execute("COMMIT")
+                return result
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def register_campaign(
+        self,
+        campaign: Dict[str, Any],
+        template_id: int,
+        loading: bool = False,
+        priority: int = 1,
+        max_rate: Optional[float] = None,
+        start_at: Optional[float] = None,
+        window_seconds: float = 0.0,
+        spread: str = "even",
+    ):
+        """Record (or reactivate) a campaign whose jobs workers should send.
+
+        A campaign registered with ``loading=True`` has its jobs sent as
+        they are enqueued but is not completed until ``finish_loading``.
+        ``start_at``, ``window_seconds`` and ``spread`` are kept so loading
+        can be resumed with the same schedule if it does not finish.
+        ``priority`` weights the campaign's share of the sends and
+        ``max_rate`` caps its leases per second across every worker sharing
+        the queue.
+        """
+        now = time.time()
+
+        def register(conn):
+            conn.execute(
+                """
+                INSERT INTO send_campaigns
+                    (campaign_id, campaign, template_id, status, priority, max_rate,
+                     start_at, window_seconds, spread, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ON CONFLICT(campaign_id) DO UPDATE SET
+                    campaign = excluded.campaign,
+                    template_id = excluded.template_id,
+                    status = excluded.status,
+                    priority = excluded.priority,
+                    max_rate = excluded.max_rate,
+                    start_at = excluded.start_at,
+                    window_seconds = excluded.window_seconds,
+                    spread = excluded.spread,
+                    load_error = NULL,
+                    updated_at = excluded.updated_at
+                """,
+                (
+                    str(campaign["id"]),
+                    json.dumps(campaign, default=str),
+                    template_id,
+                    "loading" if loading else "active",
+                    priority,
+                    max_rate,
+                    start_at if start_at is not None else now,
+                    window_seconds,
+                    spread,
+                    now,
+                    now,
+                ),
+            )
+
+        self._transaction(register)
+
+    def finish_loading(self, campaign_id: str):
+        """Mark a loading campaign's jobs as fully enqueued"""
+
+        def update(conn):
+            conn.execute(
+                """
+                UPDATE send_campaigns
+                SET status = 'active', load_error = NULL, updated_at = ?
+                WHERE campaign_id = ? AND status = 'loading'
+                """,
+                (time.time(), str(campaign_id)),
+            )
+
+        self._transaction(update)
+
+    def loading_failed(self, campaign_id: str, error: str):
+        """Record why loading a campaign stopped; it stays loading until resumed"""
+
+        def update(conn):
+            conn.execute(
+                """
+                UPDATE send_campaigns SET load_error = ?, updated_at = ?
+                WHERE campaign_id = ? AND status = 'loading'
+                """,
+                (error, time.time(), str(campaign_id)),
+            )
+
+        self._transaction(update)
+
+    def loading_campaigns(self) -> List[Dict[str, Any]]:
+        """Return the campaigns whose jobs are not fully enqueued, with
+        their load schedule, so loading can be resumed"""
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT campaign, start_at, window_seconds, spread, load_error
+                FROM send_campaigns
+                WHERE status = 'loading'
+                """
+            ).fetchall()
+        return [
+            {
+                "campaign": json.loads(row["campaign"]),
+                "start_at": row["start_at"],
+                "window_seconds": row["window_seconds"],
+                "spread": row["spread"],
+                "load_error": row["load_error"],
+            }
+            for row in rows
+        ]
+
+    def enqueue_targets(
+        self,
+        campaign: Dict[str, Any],
+        targets: Iterable[Dict[str, Any]],
+        tracking_id_factory,
+        available_at: Optional[float] = None,
+    ) -> int:
+        """Add a job per target in one transaction; already queued targets are skipped.
+
+        Jobs become due at ``available_at`` (default: now). Tracking ids are
+        only minted for targets that get a new job, so a relaunch neither
+        replaces nor caches ids of jobs that keep their old one.
+        """
+        now = time.time()
+        campaign_id = str(campaign["id"])
+        targets = {str(target["id"]): target for target in targets}
+
+        def insert(conn):
+            ids = list(targets)
+            queued = set()
+            # Stay below SQLite's default limit of 999 bound parameters
+            for start in range(0, len(ids), 500):
+                chunk = ids[start : start + 500]
+                queued.update(
+                    row[0]
+                    for row in conn.execute(
+                        f"""
+                        SELECT target_id FROM send_jobs
+                        WHERE campaign_id = ? AND target_id IN ({",".join("?" * len(chunk))})
+                        """,
+                        (campaign_id, *chunk),
+                    )
+                )
+            rows = [
+                (
+                    campaign_id,
+                    target_id,
+                    tracking_id_factory(campaign, target),
+                    json.dumps(target, default=str),
+                    available_at or now,
+                    now,
+                )
+                for target_id, target in targets.items()
+                if target_id not in queued
+            ]
+            if not rows:
+                return 0
+            return conn.executemany(
+                """
+                INSERT OR IGNORE INTO send_jobs
+                    (campaign_id, target_id, tracking_id, target, available_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                rows,
+            ).rowcount
+
+        return self._transaction(insert) if targets else 0
+
+    def enqueue_campaign(
+        self,
+        campaign: Dict[str, Any],
+        template_id: int,
+        targets: Iterable[Dict[str, Any]],
+        tracking_id_factory,
+        chunk_size: int = 1000,
+    ) -> int:
+        """Register a campaign and add a job per target, in chunks"""
+        self.register_campaign(campaign, template_id)
+
+        inserted = 0
+        chunk: List[Dict[str, Any]] = []
+        for target in targets:
+            chunk.append(target)
+            if len(chunk) >= chunk_size:
+                inserted += self.enqueue_targets(campaign, chunk, tracking_id_factory)
+                chunk = []
+        inserted += self.enqueue_targets(campaign, chunk, tracking_id_factory)
+        return inserted
+
+    def schedule_campaign(
+        self,
+        campaign_id: str,
+        start_at: float,
+        window_seconds: float,
+        spread: str = "even",
+    ) -> int:
+        """Spread a campaign's pending jobs over ``window_seconds`` from ``start_at``.
+
+        ``even`` gives every job its own evenly spaced slot. ``department``
+        spaces each department's jobs evenly over the whole window, so the
+        members of a department never receive their emails together.
+        Returns the number of jobs scheduled.
+        """
+        partition = (
+            "PARTITION BY json_extract(target, '$.department')"
+            if spread == "department"
+            else ""
+        )
+
+        def update(conn):
+            # The ready index on (status, available_at) keeps the schedule
+            # ordered on disk, so workers only ever read the due head of it.
+            # Slots are handed out in random order so recipients are not
+            # emailed in id or department-list order
+            conn.execute(
+                f"""
+                WITH slots AS (
+                    SELECT rowid AS job_id,
+                           ROW_NUMBER() OVER (
+                               {partition} ORDER BY random()
+                           ) - 1 AS slot,
+                           COUNT(*) OVER ({partition}) AS total
+                    FROM send_jobs
+                    WHERE campaign_id = ? AND status = 'pending'
+                )
+                UPDATE send_jobs
+                SET available_at = ? + ? * (slots.slot + 0.5) / slots.total,
+                    updated_at = ?
+                FROM slots
+                WHERE send_jobs.rowid = slots.job_id
+                """,
+                (str(campaign_id), start_at, window_seconds, time.time()),
+            )
+            return conn.execute("SELECT changes()").fetchone()[0]
+
+        return self._transaction(update)
+
+    def demand(self, limit: int) -> Dict[str, Dict[str, Any]]:
+        """Return due job counts (capped at ``limit`` and at what each
+        campaign's rate cap allows right now) of the running campaigns,
+        with their priority and rate cap"""
+        now = time.time()
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT c.campaign_id, c.priority, c.max_rate, c.next_eligible_at,
+                       (SELECT COUNT(*) FROM (
+                            SELECT 1 FROM send_jobs
+                            WHERE campaign_id = c.campaign_id
+                              AND status = 'pending' AND available_at <= ?
+                            LIMIT ?)) +
+                       (SELECT COUNT(*) FROM (
+                            SELECT 1 FROM send_jobs
+                            WHERE campaign_id = c.campaign_id
+                              AND status = 'leased' AND lease_expires_at <= ?
+                            LIMIT ?)) AS due
+                FROM send_campaigns c
+                WHERE c.status IN ('active', 'loading')
+                """,
+                (now, limit, now, limit),
+            ).fetchall()
+
+        demand = {}
+        for row in rows:
+            due = row["due"]
+            allowance = self._rate_allowance(row["max_rate"], row["next_eligible_at"], now)
+            if allowance is not None:
+                due = min(due, allowance)
+            demand[row["campaign_id"]] = {
+                "due": due,
+                "priority": row["priority"],
+                "max_rate": row["max_rate"],
+            }
+        return demand
+
+    def lease(
+        self,
+        worker_id: str,
+        limit: int,
+        allocation: Optional[Dict[str, int]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Lease up to ``limit`` due jobs, including jobs whose lease expired.
+
+        With an ``allocation`` of campaign id to job count, each campaign's
+        jobs are leased up to its own count instead. Rate-capped campaigns
+        never get more than their cap allows; the lease transaction
+        serializes workers, so the cap holds across processes.
+        """
+        now = time.time()
+        select = """
+            SELECT j.rowid AS job_id, j.*, c.campaign, c.template_id
+            FROM send_jobs j
+            JOIN send_campaigns c ON c.campaign_id = j.campaign_id
+            WHERE c.status IN ('active', 'loading')
+              AND ((j.status = 'pending' AND j.available_at <= ?)
+                   OR (j.status = 'leased' AND j.lease_expires_at <= ?))
+        """
+
+        def take(conn):
+            caps = {
+                row["campaign_id"]: (
+                    row["max_rate"],
+                    max(row["next_eligible_at"] or 0.0, now),
+                    self._rate_allowance(row["max_rate"], row["next_eligible_at"], now),
+                )
+                for row in conn.execute(
+                    """
+                    SELECT campaign_id, max_rate, next_eligible_at FROM send_campaigns
+                    WHERE status IN ('active', 'loading') AND max_rate > 0
+                    """
+                )
+            }
+
+            if allocation is None:
+                # Uncapped campaigns in one query, each capped one up to its
+                # allowance, merged back into due order
+                excluded = ",".join("?" * len(caps))
+                rows = conn.execute(
+                    select
+                    + (f" AND j.campaign_id NOT IN ({excluded})" if caps else "")
+                    + " ORDER BY j.available_at LIMIT ?",
+                    (now, now, *caps, limit),
+                ).fetchall()
+                for campaign_id, (_, _, allowance) in caps.items():
+                    if allowance > 0:
+                        rows.extend(
+                            conn.execute(
+                                select
+                                + " AND j.campaign_id = ? ORDER BY j.available_at LIMIT ?",
+                                (now, now, campaign_id, min(allowance, limit)),
+                            ).fetchall()
+                        )
+                rows = sorted(rows, key=lambda row: row["available_at"])[:limit]
+            else:
+                rows = []
+                for campaign_id, count in allocation.items():
+                    if campaign_id in caps:
+                        count = min(count, caps[campaign_id][2])
+                    if count <= 0:
+                        continue
+                    rows.extend(
+                        conn.execute(
+                            select + " AND j.campaign_id = ? ORDER BY j.available_at LIMIT ?",
+                            (now, now, campaign_id, count),
+                        ).fetchall()
+                    )
+
+            leased: Dict[str, int] = {}
+            for row in rows:
+                leased[row["campaign_id"]] = leased.get(row["campaign_id"], 0) + 1
+            conn.executemany(
+                "UPDATE send_campaigns SET next_eligible_at = ? WHERE campaign_id = ?",
+                [
+                    (caps[campaign_id][1] + count / caps[campaign_id][0], campaign_id)
+                    for campaign_id, count in leased.items()
+                    if campaign_id in caps
+                ],
+            )
+
+            conn.executemany(
+                """
+                UPDATE send_jobs
+                SET status = 'leased', lease_owner = ?, lease_expires_at = ?,
+                    attempts = attempts + 1, updated_at = ?
+                WHERE rowid = ?
+                """,
+                [
+                    (worker_id, now + self.visibility_timeout, now, row["job_id"])
+                    for row in rows
+                ],
+            )
+            return rows
+
+        jobs = []
+        for row in self._transaction(take):
+            target = json.loads(row["target"])
+            target["tracking_id"] = row["tracking_id"]
+            jobs.append(
+                {
+                    "job_id": row["job_id"],
+                    "campaign_id": row["campaign_id"],
+                    "campaign": json.loads(row["campaign"]),
+                    "template_id": row["template_id"],
+                    "target": target,
+                    "attempts": row["attempts"] + 1,
+                }
+            )
+        return jobs
+
+    def complete(self, job: Dict[str, Any], worker_id: str) -> bool:
+        """Mark a leased job as sent; returns False if the lease was lost"""
+        return bool(self.complete_many([job], worker_id))
+
+    def complete_many(
+        self, jobs: List[Dict[str, Any]], worker_id: str
+    ) -> List[Dict[str, Any]]:
+        """Mark leased jobs as sent in one transaction; returns the jobs
+        whose lease was still held"""
+        return self._finish_many(
+            [(job, "sent", None, None) for job in jobs], worker_id
+        )
+
+    def fail(
+        self,
+        job: Dict[str, Any],
+        worker_id: str,
+        error: str,
+        retry_delay: float = 0.0,
+    ) -> bool:
+        """Release a job for retry, or fail it permanently after max_attempts"""
+        return bool(self.fail_many([(job, error)], worker_id, retry_delay))
+
+    def fail_many(
+        self,
+        failures: List[Tuple[Dict[str, Any], Optional[str]]],
+        worker_id: str,
+        retry_delay: float = 0.0,
+    ) -> List[Dict[str, Any]]:
+        """Release ``(job, error)`` pairs for retry in one transaction, failing
+        jobs permanently after max_attempts; returns the jobs whose lease was
+        still held"""
+        retry_at = time.time() + retry_delay
+        return self._finish_many(
+            [
+                (job, "failed", error, None)
+                if job["attempts"] >= self.max_attempts
+                else (job, "pending", error, retry_at)
+                for job, error in failures
+            ],
+            worker_id,
+        )
+
+    def _finish_many(self, updates, worker_id) -> List[Dict[str, Any]]:
+        if not updates:
+            return []
+        now = time.time()
+
+        def update(conn):
+            return [
+                job
+                for job, status, error, available_at in updates
+                if conn.execute(
+                    """
+                    UPDATE send_jobs
+                    SET status = ?, last_error = ?, lease_owner = NULL,
+                        lease_expires_at = NULL,
+                        available_at = COALESCE(?, available_at), updated_at = ?
+                    WHERE rowid = ? AND status = 'leased' AND lease_owner = ?
+                    """,
+                    (status, error, available_at, now, job["job_id"], worker_id),
+                ).rowcount
+                == 1
+            ]
+
+        return self._transaction(update)
+
+    def campaign_counts(self, campaign_id: str) -> Dict[str, int]:
+        """Return job counts by status for a campaign"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) FROM send_jobs WHERE campaign_id = ? GROUP BY status",
+                (str(campaign_id),),
+            ).fetchall()
+        counts = {"pending": 0, "leased": 0, "sent": 0, "failed": 0}
+        counts.update({row[0]: row[1] for row in rows})
+        return counts
+
+    def campaign_progress(self, campaign_id: str) -> Optional[Dict[str, Any]]:
+        """Job counts of a campaign from the shared queue database.
+
+        Works in any process using the queue, whether or not it sends the
+        campaign; returns None if the campaign was never queued.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, load_error FROM send_campaigns WHERE campaign_id = ?",
+                (str(campaign_id),),
+            ).fetchone()
+        if row is None:
+            return None
+        counts = self.campaign_counts(campaign_id)
+        total = sum(counts.values())
+        completed = counts["sent"] + counts["failed"]
+        return {
+            "campaign_id": str(campaign_id),
+            "total": total,
+            "completed": completed,
+            "remaining": total - completed,
+            "sent": counts["sent"],
+            "failed": counts["failed"],
+            "loading": row["status"] == "loading",
+            "load_error": row["load_error"],
+            "finished": row["status"] == "completed",
+        }
+
+    def running_campaigns(self) -> List[Dict[str, Any]]:
+        """Return the running campaigns with their priority, rate cap and queue depth"""
+        with self._lock:
+            rows = self._conn.execute(
+                """
+                SELECT c.campaign_id, c.status, c.priority, c.max_rate,
+                       COUNT(CASE WHEN j.status = 'pending' THEN 1 END) AS pending,
+                       COUNT(CASE WHEN j.status = 'leased' THEN 1 END) AS leased
+                FROM send_campaigns c
+                LEFT JOIN send_jobs j
+                  ON j.campaign_id = c.campaign_id AND j.status IN ('pending', 'leased')
+                WHERE c.status IN ('active', 'loading')
+                GROUP BY c.campaign_id
+                """
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def finish_campaign(self, campaign_id: str) -> bool:
+        """Mark a campaign completed once no jobs remain; True for the caller that does it"""
+
+        def update(conn):
+            return conn.execute(
+                """
+                UPDATE send_campaigns SET status = 'completed', updated_at = ?
+                WHERE campaign_id = ? AND status = 'active'
+                  AND NOT EXISTS (
+                      SELECT 1 FROM send_jobs
+                      WHERE campaign_id = ? AND status IN ('pending', 'leased')
+                  )
+                """,
+                (time.time(), str(campaign_id), str(campaign_id)),
+            ).rowcount
+
+        return self._transaction(update) == 1
@@ -0,0 +1,160 @@
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+STAGES = ("render", "send", "db")
+
+
+class SlidingWindowCounter:
+    """Event counts in one-second buckets over the last ``window_seconds``"""
+
+    def __init__(self, window_seconds: int = 60):
+        self.window_seconds = window_seconds
+        self._buckets: Deque[Tuple[int, int]] = deque()
+
+    def add(self, count: int = 1):
+        second = int(time.time())
+        if self._buckets and self._buckets[-1][0] == second:
+            self._buckets[-1] = (second, self._buckets[-1][1] + count)
+        else:
+            self._buckets.append((second, count))
+        while self._buckets and self._buckets[0][0] <= second - self.window_seconds:
+            self._buckets.popleft()
+
+    def rate(self, seconds: Optional[int] = None) -> float:
+        """Events per second over the last ``seconds`` (default: whole window)"""
+        seconds = min(seconds or self.window_seconds, self.window_seconds)
+        since = int(time.time()) - seconds
+        return sum(n for second, n in self._buckets if second > since) / seconds
+
+
+class CampaignProgress:
+    """Live send counters, throughput, stage latencies and ETA of one campaign"""
+
+    def __init__(self, campaign_id: str, total: Optional[int] = None, completed: int = 0):
+        self.campaign_id = campaign_id
+        self.total = total
+        # Targets already done before this process started tracking
+        self.completed_before = completed
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.finished = False
+        self.started_at = time.time()
+        self.updated_at = self.started_at
+        self.throughput = SlidingWindowCounter(60)
+        self.latencies: Dict[str, Deque[float]] = {
+            stage: deque(maxlen=512) for stage in STAGES
+        }
+
+    def _touch(self):
+        self.updated_at = time.time()
+
+    def record_sent(self):
+        self.sent += 1
+        self.throughput.add()
+        self._touch()
+
+    def record_failed(self):
+        self.failed += 1
+        self.throughput.add()
+        self._touch()
+
+    def record_retry(self):
+        self.retried += 1
+        self._touch()
+
+    def observe(self, stage: str, seconds: float):
+        """Record how long one render, send or status write took"""
+        self.latencies[stage].append(seconds)
+
+    def finish(self):
+        self.finished = True
+        self._touch()
+
+    def _latency_summary(self, samples: Deque[float]) -> Dict[str, Any]:
+        if not samples:
+            return {"avg_ms": None, "p50_ms": None, "p95_ms": None}
+        ordered = sorted(samples)
+        return {
+            "avg_ms": round(1000 * sum(ordered) / len(ordered), 2),
+            "p50_ms": round(1000 * ordered[len(ordered) // 2], 2),
+            "p95_ms": round(
+                1000 * ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))], 2
+            ),
+        }
+
+    def snapshot(self) -> Dict[str, Any]:
+        completed = self.completed_before + self.sent + self.failed
+        rate_10s = self.throughput.rate(10)
+        rate_60s = self.throughput.rate(60)
+        remaining = None if self.total is None else max(0, self.total - completed)
+
+        # The minute average is steadier; fall back to the last 10s early on
+        rate = rate_60s if time.time() - self.started_at >= 60 else rate_10s
+        if self.finished or remaining == 0:
+            eta = 0.0
+        elif remaining is not None and rate > 0:
+            eta = round(remaining / rate, 1)
+        else:
+            eta = None
+
+        return {
+            "campaign_id": self.campaign_id,
+            "total": self.total,
+            "completed": completed,
+            "remaining": remaining,
+            "sent": self.sent,
+            "failed": self.failed,
+            "retried": self.retried,
+            "emails_per_second": {"10s": round(rate_10s, 2), "60s": round(rate_60s, 2)},
+            "latency": {
+                stage: self._latency_summary(samples)
+                for stage, samples in self.latencies.items()
+            },
+            "eta_seconds": eta,
+            "finished": self.finished,
+            "started_at": self.started_at,
+            "updated_at": self.updated_at,
+        }
+
+
+class SendTelemetry:
+    """Progress trackers of the campaigns this process is sending.
+
+    Finished campaigns are kept for a while so late subscribers still get
+    their final numbers; the oldest are dropped past ``max_finished``.
+    """
+
+    def __init__(self, max_finished: int = 100):
+        self.max_finished = max_finished
+        self._campaigns: "OrderedDict[str, CampaignProgress]" = OrderedDict()
+
+    def get(self, campaign_id: str) -> Optional[CampaignProgress]:
+        return self._campaigns.get(str(campaign_id))
+
+    def start(
+        self, campaign_id: str, total: Optional[int] = None, completed: int = 0
+    ) -> CampaignProgress:
+        """Begin (or restart) tracking a campaign"""
+        campaign_id = str(campaign_id)
+        progress = CampaignProgress(campaign_id, total, completed)
+        self._campaigns[campaign_id] = progress
+        self._campaigns.move_to_end(campaign_id)
+        self._prune()
+        return progress
+
+    def campaign(self, campaign_id: str) -> CampaignProgress:
+        """Return the tracker of a campaign, starting one if needed"""
+        return self.get(campaign_id) or self.start(campaign_id)
+
+    def finish(self, campaign_id: str):
+        progress = self.get(campaign_id)
+        if progress:
+            progress.finish()
+            self._prune()
+
+    def _prune(self):
+        finished = [c for c, p in self._campaigns.items() if p.finished]
+        for campaign_id in finished[: max(0, len(finished) - self.max_finished)]:
+            del self._campaigns[campaign_id]
@@ -0,0 +1,107 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class CachedStats:
+    """Computed stats of a campaign with their serialized body and ETag"""
+
+    def __init__(self, stats: Dict[str, Any], expires_at: float):
+        self.stats = stats
+        self.body = json.dumps(stats, separators=(",", ":"), default=str).encode("utf-8")
+        # last_updated is stamped on every computation, so it stays out of
+        # the ETag or identical stats would never match
+        fingerprint = {k: v for k, v in stats.items() if k != "last_updated"}
+        self.etag = '"{}"'.format(
+            hashlib.sha1(
+                json.dumps(fingerprint, sort_keys=True, default=str).encode("utf-8")
+            ).hexdigest()[:20]
+        )
+        self.computed_at = time.monotonic()
+        self.expires_at = expires_at
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        if not if_none_match:
+            return False
+        tags = [t.strip() for t in if_none_match.split(",")]
+        return "*" in tags or self.etag in tags or f"W/{self.etag}" in tags
+
+
+class CampaignStatsCache:
+    """Per-campaign stats cache with single-flight refresh.
+
+    Stats are recomputed at most once per ``ttl`` seconds; concurrent
+    requests for a stale campaign share one computation. ``invalidate``
+    marks a campaign changed by tracking or sending so the next request
+    recomputes it, but never sooner than ``min_age`` after the last
+    computation, which keeps a busy campaign from recounting on every poll.
+    """
+
+    def __init__(self, supabase_client, max_entries: int = 1000):
+        self.supabase_client = supabase_client
+        self.ttl = float(os.getenv("CAMPAIGN_STATS_TTL_SECONDS", 10))
+        self.min_age = float(os.getenv("CAMPAIGN_STATS_MIN_AGE_SECONDS", 1))
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, CachedStats]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._generations: Dict[str, int] = {}
+        self.hits = 0
+        self.misses = 0
+
+    async def get(self, campaign_id: str) -> CachedStats:
+        campaign_id = str(campaign_id)
+        entry = self._entries.get(campaign_id)
+        if entry is not None and time.monotonic() < entry.expires_at:
+            self.hits += 1
+            self._entries.move_to_end(campaign_id)
+            return entry
+
+        inflight = self._inflight.get(campaign_id)
+        if inflight is None:
+            self.misses += 1
+            inflight = asyncio.ensure_future(self._refresh(campaign_id))
+            self._inflight[campaign_id] = inflight
+            inflight.add_done_callback(lambda _: self._inflight.pop(campaign_id, None))
+        else:
+            self.hits += 1
+        # Shielded so a poller hanging up does not cancel the others' result
+        return await asyncio.shield(inflight)
+
+    async def _refresh(self, campaign_id: str) -> CachedStats:
+        generation = self._generations.get(campaign_id, 0)
+        stats = await self.supabase_client.get_campaign_stats(campaign_id)
+
+        ttl = self.ttl
+        if self._generations.get(campaign_id, 0) != generation:
+            # Invalidated while computing, so these stats may already be behind
+            ttl = self.min_age
+        entry = CachedStats(stats, time.monotonic() + ttl)
+        if stats:
+            self._entries[campaign_id] = entry
+            self._entries.move_to_end(campaign_id)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._generations.pop(evicted, None)
+        return entry
+
+    def invalidate(self, campaign_id: str):
+        campaign_id = str(campaign_id)
+        self._generations[campaign_id] = self._generations.get(campaign_id, 0) + 1
+        entry = self._entries.get(campaign_id)
+        if entry is not None:
+            entry.expires_at = min(entry.expires_at, entry.computed_at + self.min_age)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
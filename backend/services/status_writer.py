@@ -0,0 +1,192 @@
+import os
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict, Any, Iterable, List, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class TargetStatusWriter:
+    """Write-behind buffer for campaign target status updates.
+
+    Updates are buffered per target and flushed as bulk upserts once
+    ``max_rows`` targets are pending or ``flush_interval_ms`` has passed.
+    Later updates to a target are merged over earlier ones in the buffer,
+    and flushes never overlap, so each target's updates land in order.
+
+    A failed bulk write is bisected to find the rows that fail; the rest
+    are written and the failing rows retried with the next flush. Rows that
+    fail ``max_attempts`` times, or that do not fit in ``max_buffered``,
+    are moved to a bounded dead letter list instead of being retried
+    forever. Callers use ``unwritten`` to tell which targets did not make
+    it to the database.
+    """
+
+    def __init__(self, supabase_client):
+        self.supabase_client = supabase_client
+        self.max_rows = int(os.getenv("STATUS_FLUSH_ROWS", 500))
+        self.flush_interval = float(os.getenv("STATUS_FLUSH_INTERVAL_MS", 250)) / 1000
+        self.max_attempts = int(os.getenv("STATUS_FLUSH_MAX_ATTEMPTS", 5))
+        self.max_buffered = int(os.getenv("STATUS_MAX_BUFFERED", 10000))
+        self.max_dead_letters = int(os.getenv("STATUS_MAX_DEAD_LETTERS", 10000))
+
+        self._buffer: Dict[str, Dict[str, Any]] = {}
+        self._attempts: Dict[str, int] = {}
+        self._dead_letters: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._flusher: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.rows_written = 0
+        self.rows_dead_lettered = 0
+
+    def add(
+        self,
+        target_id: str,
+        status: str,
+        tracking_id: Optional[str] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+    ):
+        """Buffer a status transition for a target"""
+        update = self.supabase_client.build_target_status_update(
+            status, tracking_id, metadata
+        )
+        # A new transition supersedes an update that was given up on
+        self._dead_letters.pop(target_id, None)
+        self._merge(target_id, update)
+
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._run())
+        if len(self._buffer) >= self.max_rows:
+            self._wakeup.set()
+
+    def _merge(self, target_id: str, update: Dict[str, Any]):
+        row = self._buffer.get(target_id)
+        if row is None:
+            self._buffer[target_id] = {"id": target_id, **update}
+        else:
+            row.update(update)
+
+    def unwritten(self, target_ids: Iterable[str]) -> Set[str]:
+        """Targets whose latest update is still buffered or was dead-lettered"""
+        return {
+            target_id
+            for target_id in target_ids
+            if target_id in self._buffer or target_id in self._dead_letters
+        }
+
+    async def _run(self):
+        while self._buffer:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+
+    async def flush(self) -> int:
+        """Write all buffered updates; returns the number of rows written"""
+        async with self._flush_lock:
+            if not self._buffer:
+                return 0
+
+            rows, self._buffer = self._buffer, {}
+            failed = await self._write(list(rows.values()))
+            written = len(rows) - len(failed)
+            failed_ids = {row["id"] for row in failed}
+            for target_id in rows:
+                if target_id not in failed_ids:
+                    self._attempts.pop(target_id, None)
+            if written:
+                self.flushes += 1
+                self.rows_written += written
+            if failed:
+                self._requeue(failed)
+            return written
+
+    async def _write(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Write rows as one bulk upsert; returns the rows that failed"""
+        if await self.supabase_client.bulk_update_target_status(rows):
+            return []
+        return await self._bisect(rows)
+
+    async def _bisect(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Narrow a failed write down to the rows that fail on their own"""
+        if len(rows) == 1:
+            return rows
+        middle = len(rows) // 2
+        halves = [rows[:middle], rows[middle:]]
+        results = [
+            await self.supabase_client.bulk_update_target_status(half) for half in halves
+        ]
+        if not any(results):
+            # Both halves failing points at the database rather than a row,
+            # so stop here instead of issuing a write per row
+            return rows
+        failed = []
+        for half, ok in zip(halves, results):
+            if not ok:
+                failed.extend(await self._bisect(half))
+        return failed
+
+    def _requeue(self, rows: List[Dict[str, Any]]):
+        """Put failed rows back under any newer updates so they are retried
+        without overwriting later transitions, dead-lettering the ones that
+        keep failing or do not fit"""
+        requeue: Dict[str, Dict[str, Any]] = {}
+        for row in rows:
+            target_id = row["id"]
+            attempts = self._attempts.get(target_id, 0) + 1
+            if attempts >= self.max_attempts:
+                self._dead_letter(row, f"failed {attempts} times")
+            else:
+                self._attempts[target_id] = attempts
+                requeue[target_id] = row
+
+        room = max(0, self.max_buffered - len(self._buffer))
+        for target_id in list(requeue)[room:]:
+            self._dead_letter(requeue.pop(target_id), "status buffer full")
+
+        if requeue:
+            logger.warning(f"Requeueing {len(requeue)} target status updates")
+        newer, self._buffer = self._buffer, requeue
+        for target_id, update in newer.items():
+            self._merge(target_id, update)
+
+    def _dead_letter(self, row: Dict[str, Any], reason: str):
+        target_id = row["id"]
+        self._attempts.pop(target_id, None)
+        logger.error(f"Giving up on status update of target {target_id} ({reason}): {row}")
+        self._dead_letters[target_id] = row
+        self._dead_letters.move_to_end(target_id)
+        while len(self._dead_letters) > self.max_dead_letters:
+            self._dead_letters.popitem(last=False)
+        self.rows_dead_lettered += 1
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "buffered": len(self._buffer),
+            "max_buffered": self.max_buffered,
+            "dead_letters": len(self._dead_letters),
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "rows_dead_lettered": self.rows_dead_lettered,
+        }
+
+    async def close(self) -> bool:
+        """Flush everything that is still buffered and stop the flusher.
+
+        Returns False if updates were left unwritten.
+        """
+        if self._flusher and not self._flusher.done():
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+        await self.flush()
+        if self._buffer:
+            logger.error(f"Lost {len(self._buffer)} target status updates on shutdown")
+            return False
+        return True
@@ -1,12 +1,37 @@
 import os
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, AsyncIterator
 from supabase import create_client, Client
+from postgrest.exceptions import APIError
+from postgrest.types import CountMethod, ReturnMethod
 from datetime import datetime
 import asyncio
 
+from utils.lru_cache import LRUCache
+from utils.tracking_tokens import TrackingToken, is_legacy_token
+
 logger = logging.getLogger(__name__)
 
+# Target status each tracking event moves a target to
+EVENT_STATUSES = {
+    "opened": "opened",
+    "clicked": "clicked",
+    "landed": "clicked",
+    "submitted": "submitted",
+    "reported": "reported",
+}
+
+
+def _percentile(values: List[float], fraction: float) -> float:
+    """Linearly interpolated percentile, as PERCENTILE_CONT computes it"""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    position = (len(ordered) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(ordered) - 1)
+    return ordered[lower] + (ordered[upper] - ordered[lower]) * (position - lower)
+
 
 class SupabaseClient:
     def __init__(self):
@@ -15,6 +40,12 @@ class SupabaseClient:
         self.supabase_service_key = os.getenv("SUPABASE_SERVICE_ROLE_KEY")
         self.client: Optional[Client] = None
         self.service_client: Optional[Client] = None
+        # Cleared if the database lacks campaign_stats_summary
+        self.stats_rpc_available = True
+        # Legacy tracking id -> target and campaign; warmed as ids are issued
+        self.tracking_cache: LRUCache[TrackingToken] = LRUCache(
+            int(os.getenv("TRACKING_CACHE_SIZE", 50000))
+        )
 
     async def initialize(self):
         """Initialize Supabase clients"""
@@ -124,6 +155,65 @@ class SupabaseClient:
             logger.error(f"Error getting campaign targets for {campaign_id}: {str(e)}")
             return []
 
+    async def count_pending_campaign_targets(self, campaign_id: str) -> int:
+        """Count the pending targets of a campaign without fetching them.
+
+        Errors are raised rather than counted as zero, so a broken schema is
+        not reported as a campaign without targets.
+        """
+        try:
+            result = await asyncio.to_thread(
+                self.service_client.table("campaign_target_queue")
+                .select("id", count=CountMethod.exact)
+                .eq("campaign_id", campaign_id)
+                .eq("status", "pending")
+                .limit(1)
+                .execute
+            )
+            return result.count or 0
+        except APIError as e:
+            logger.error(f"Error counting campaign targets for {campaign_id}: {str(e)}")
+            if e.code in ("PGRST205", "42P01"):
+                raise RuntimeError(
+                    "The campaign_target_queue view is missing; apply the latest "
+                    "database schema"
+                ) from e
+            raise
+
+    async def iter_campaign_target_pages(
+        self, campaign_id: str, page_size: int = 1000
+    ) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Stream the pending targets of a campaign in pages.
+
+        Pages come from the flat campaign_target_queue view using keyset
+        pagination on id. The partial index on the targets' (campaign_id, id)
+        makes each page an index range scan, and memory stays bounded by
+        page_size regardless of campaign size.
+        """
+        last_id = None
+        while True:
+            query = (
+                self.service_client.table("campaign_target_queue")
+                .select("id, email, name, department, employee_id, campaign_target_id")
+                .eq("campaign_id", campaign_id)
+                .eq("status", "pending")
+            )
+            if last_id is not None:
+                query = query.gt("id", last_id)
+
+            # Run the blocking HTTP call off the event loop
+            result = await asyncio.to_thread(
+                query.order("id").limit(page_size).execute
+            )
+            page = result.data or []
+            if not page:
+                return
+
+            yield page
+            if len(page) < page_size:
+                return
+            last_id = page[-1]["id"]
+
     async def update_campaign_status(self, campaign_id: str, status: str) -> bool:
         """Update campaign status"""
         try:
@@ -155,25 +245,7 @@ class SupabaseClient:
     ) -> bool:
         """Update target employee status"""
         try:
-            update_data = {
-                "status": status,
-                "updated_at": datetime.utcnow().isoformat(),
-            }
-
-            if tracking_id:
-                update_data["tracking_id"] = tracking_id
-
-            if status == "sent":
-                update_data["sent_at"] = datetime.utcnow().isoformat()
-            elif status == "opened":
-                update_data["opened_at"] = datetime.utcnow().isoformat()
-            elif status == "clicked":
-                update_data["clicked_at"] = datetime.utcnow().isoformat()
-            elif status == "reported":
-                update_data["reported_at"] = datetime.utcnow().isoformat()
-
-            if metadata:
-                update_data["metadata"] = metadata
+            update_data = self.build_target_status_update(status, tracking_id, metadata)
 
             result = (
                 self.service_client.table("campaign_target_employees")
@@ -186,6 +258,58 @@ class SupabaseClient:
             logger.error(f"Error updating target status: {str(e)}")
             return False
 
+    def build_target_status_update(
+        self,
+        status: str,
+        tracking_id: Optional[str] = None,
+        metadata: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """Build the column values for a target status transition"""
+        update_data = {
+            "status": status,
+            "updated_at": datetime.utcnow().isoformat(),
+        }
+
+        if tracking_id:
+            update_data["tracking_id"] = tracking_id
+
+        if status == "sent":
+            update_data["sent_at"] = datetime.utcnow().isoformat()
+        elif status == "opened":
+            update_data["opened_at"] = datetime.utcnow().isoformat()
+        elif status == "clicked":
+            update_data["clicked_at"] = datetime.utcnow().isoformat()
+        elif status == "reported":
+            update_data["reported_at"] = datetime.utcnow().isoformat()
+
+        if metadata:
+            update_data["metadata"] = metadata
+
+        return update_data
+
+    async def bulk_update_target_status(self, rows: List[Dict[str, Any]]) -> bool:
+        """Apply many target status updates as bulk upserts keyed on id.
+
+        Each row holds an ``id`` plus the columns to set. Rows are grouped
+        by column set because a bulk upsert writes the same columns for
+        every row.
+        """
+        try:
+            groups: Dict[tuple, List[Dict[str, Any]]] = {}
+            for row in rows:
+                groups.setdefault(tuple(sorted(row)), []).append(row)
+
+            for group in groups.values():
+                await asyncio.to_thread(
+                    self.service_client.table("campaign_target_employees")
+                    .upsert(group, on_conflict="id", returning=ReturnMethod.minimal)
+                    .execute
+                )
+            return True
+        except Exception as e:
+            logger.error(f"Error bulk updating target status: {str(e)}")
+            return False
+
     async def update_campaign_stats(
         self, campaign_id: str, stats: Dict[str, Any]
     ) -> bool:
@@ -196,62 +320,112 @@ class SupabaseClient:
                 "total_sent": stats.get("total_sent"),
                 "total_opened": stats.get("total_opened"),
                 "total_clicked": stats.get("total_clicked"),
+                "total_submitted": stats.get("total_submitted"),
                 "total_reported": stats.get("total_reported"),
+                "total_failed": stats.get("total_failed"),
                 "updated_at": datetime.utcnow().isoformat(),
             }
 
             # Filter out None values so we don't overwrite with null
             update_data = {k: v for k, v in update_data.items() if v is not None}
 
-            result = (
+            await asyncio.to_thread(
                 self.service_client.table("campaigns")
                 .update(update_data)
                 .eq("id", campaign_id)
-                .execute()
+                .execute
             )
             return True
         except Exception as e:
             logger.error(f"Error updating campaign stats: {str(e)}")
             return False
 
+    async def increment_campaign_stats(
+        self, campaign_id: str, deltas: Dict[str, int]
+    ) -> bool:
+        """Atomically add ``deltas`` (e.g. ``{"total_clicked": 3}``) to campaign totals"""
+        try:
+            await asyncio.to_thread(
+                self.service_client.rpc(
+                    "increment_campaign_stats",
+                    {"p_campaign_id": campaign_id, "p_deltas": deltas},
+                ).execute
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Error incrementing campaign stats: {str(e)}")
+            return False
+
+    async def get_target_milestones(
+        self, target_ids: List[str]
+    ) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Current status and event timestamps of many targets, keyed by id.
+
+        Returns None if the lookup failed, so callers can tell "no targets"
+        from "unknown".
+        """
+        if not target_ids:
+            return {}
+        try:
+            result = await asyncio.to_thread(
+                self.service_client.table("campaign_target_employees")
+                .select("id, status, opened_at, clicked_at, reported_at")
+                .in_("id", list(target_ids))
+                .execute
+            )
+            return {row["id"]: row for row in result.data or []}
+        except Exception as e:
+            logger.error(f"Error getting target milestones: {str(e)}")
+            return None
+
     async def record_tracking_event(
         self,
         tracking_id: str,
         event_type: str,
         metadata: Optional[Dict[str, Any]] = None,
+        token: Optional[TrackingToken] = None,
     ) -> Optional[str]:
-        """Record a tracking event and return the campaign_id"""
-        try:
-            # First, get the target by tracking_id
-            target_result = (
-                self.service_client.table("campaign_target_employees")
-                .select("id, campaign_target_id")
-                .eq("tracking_id", tracking_id)
-                .single()
-                .execute()
-            )
+        """Record a tracking event and return the campaign_id.
 
-            if not target_result.data:
-                logger.warning(f"No target found for tracking_id: {tracking_id}")
+        A verified signed ``token`` already names the target and campaign,
+        so only legacy uuid tracking ids are looked up.
+        """
+        try:
+            if token is None and not is_legacy_token(tracking_id):
+                logger.warning(f"Rejected invalid tracking token: {tracking_id}")
                 return None
 
-            target_id = target_result.data["id"]
-            campaign_target_id = target_result.data["campaign_target_id"]
+            if token is None:
+                token = self.tracking_cache.get(tracking_id)
 
-            # Update target status based on event type
-            if event_type == "opened":
-                await self.update_target_status(target_id, "opened", metadata=metadata)
-            elif event_type == "clicked" or event_type == "landed":
-                await self.update_target_status(target_id, "clicked", metadata=metadata)
-            elif event_type == "submitted":
-                await self.update_target_status(
-                    target_id, "submitted", metadata=metadata
-                )
-            elif event_type == "reported":
-                await self.update_target_status(
-                    target_id, "reported", metadata=metadata
+            if token is not None:
+                target_id = token.target_id
+                campaign_target_id = None
+            else:
+                # First, get the target by tracking_id
+                target_result = (
+                    self.service_client.table("campaign_target_employees")
+                    .select("id, campaign_target_id")
+                    .eq("tracking_id", tracking_id)
+                    .single()
+                    .execute()
                 )
 
+                if not target_result.data:
+                    logger.warning(f"No target found for tracking_id: {tracking_id}")
+                    return None
+
+                target_id = target_result.data["id"]
+                campaign_target_id = target_result.data["campaign_target_id"]
+
+            # Update target status based on event type
+            status = EVENT_STATUSES.get(event_type)
+            if status:
+                await self.update_target_status(target_id, status, metadata=metadata)
+
+            if token is not None:
+                return token.campaign_id
+
             # Get campaign_id
             campaign_target = (
                 self.service_client.table("campaign_targets")
@@ -266,14 +440,99 @@ class SupabaseClient:
                 return None
 
             campaign_id = campaign_target.data["campaign_id"]
+            self.tracking_cache.put(tracking_id, TrackingToken(target_id, campaign_id))
 
             return campaign_id
         except Exception as e:
             logger.error(f"Error recording tracking event: {str(e)}")
             return None
 
+    async def resolve_tracking_ids(
+        self, tracking_ids: List[str]
+    ) -> Optional[Dict[str, TrackingToken]]:
+        """Look up the target and campaign of many legacy tracking ids at once.
+
+        Unknown ids are left out. Returns None if the lookup failed, so
+        callers can retry rather than treat every id as unknown.
+        """
+        resolved: Dict[str, TrackingToken] = {}
+        missing = []
+        for tracking_id in tracking_ids:
+            token = self.tracking_cache.get(tracking_id)
+            if token is None:
+                missing.append(tracking_id)
+            else:
+                resolved[tracking_id] = token
+        if not missing:
+            return resolved
+        try:
+            targets = await asyncio.to_thread(
+                self.service_client.table("campaign_target_employees")
+                .select("id, tracking_id, campaign_target_id")
+                .in_("tracking_id", missing)
+                .execute
+            )
+            if not targets.data:
+                return resolved
+
+            campaign_target_ids = {row["campaign_target_id"] for row in targets.data}
+            campaign_targets = await asyncio.to_thread(
+                self.service_client.table("campaign_targets")
+                .select("id, campaign_id")
+                .in_("id", list(campaign_target_ids))
+                .execute
+            )
+            campaigns = {row["id"]: row["campaign_id"] for row in campaign_targets.data}
+
+            for row in targets.data:
+                campaign_id = campaigns.get(row["campaign_target_id"])
+                if campaign_id:
+                    token = TrackingToken(row["id"], campaign_id)
+                    resolved[row["tracking_id"]] = token
+                    self.tracking_cache.put(row["tracking_id"], token)
+            return resolved
+        except Exception as e:
+            logger.error(f"Error resolving tracking ids: {str(e)}")
+            return None
+
     async def get_campaign_stats(self, campaign_id: str) -> Dict[str, Any]:
-        """Get comprehensive campaign statistics"""
+        """Get comprehensive campaign statistics.
+
+        Aggregated in the database by ``campaign_stats_summary`` so only one
+        row comes back; databases without the function are counted in Python.
+        """
+        if not self.stats_rpc_available:
+            return await self._count_campaign_stats(campaign_id)
+
+        try:
+            result = await asyncio.to_thread(
+                self.service_client.rpc(
+                    "campaign_stats_summary", {"p_campaign_id": campaign_id}
+                ).execute
+            )
+        except APIError as e:
+            if e.code == "PGRST202":
+                logger.warning(
+                    "campaign_stats_summary is not installed; counting stats in Python"
+                )
+                self.stats_rpc_available = False
+            else:
+                logger.error(f"Error aggregating campaign stats: {str(e)}")
+            return await self._count_campaign_stats(campaign_id)
+        except Exception as e:
+            logger.error(f"Error aggregating campaign stats: {str(e)}")
+            return await self._count_campaign_stats(campaign_id)
+
+        if not result.data:
+            return {}
+        stats = dict(result.data[0])
+        # Landing page views are recorded as clicks
+        stats["landing_viewed"] = stats["total_clicked"]
+        stats["last_updated"] = datetime.utcnow().isoformat()
+        return stats
+
+    async def _count_campaign_stats(self, campaign_id: str) -> Dict[str, Any]:
+        """Count campaign statistics from every target row of the campaign"""
         try:
             # Get campaign basic info
             campaign = await self.get_campaign(campaign_id)
@@ -281,7 +540,7 @@ class SupabaseClient:
                 return {}
 
             # Get detailed stats from campaign_target_employees
-            result = (
+            result = await asyncio.to_thread(
                 self.service_client.table("campaign_target_employees")
                 .select("""
                     status,
@@ -294,7 +553,7 @@ class SupabaseClient:
                     )
                 """)
                 .eq("campaign_targets.campaign_id", campaign_id)
-                .execute()
+                .execute
             )
 
             stats = {
@@ -314,8 +573,7 @@ class SupabaseClient:
 
             if result.data:
                 stats["total_targets"] = len(result.data)
-                total_click_time = 0
-                clicks_with_time = 0
+                click_times = []
 
                 for row in result.data:
                     status = row["status"]
@@ -328,8 +586,7 @@ class SupabaseClient:
                         if row.get("sent_at") and row.get("clicked_at"):
                             sent_at = datetime.fromisoformat(row["sent_at"])
                             clicked_at = datetime.fromisoformat(row["clicked_at"])
-                            total_click_time += (clicked_at - sent_at).total_seconds()
-                            clicks_with_time += 1
+                            click_times.append((clicked_at - sent_at).total_seconds())
                     if status == "submitted":
                         stats["total_submitted"] += 1
                     if status == "reported" or row.get("reported_at"):
@@ -340,11 +597,12 @@ class SupabaseClient:
                 # Add landing viewed (same as clicked)
                 stats["landing_viewed"] = stats["total_clicked"]
 
-                # Calculate average time to click
-                if clicks_with_time > 0:
-                    stats["avg_time_to_click"] = total_click_time / clicks_with_time
-                else:
-                    stats["avg_time_to_click"] = 0
+                # Calculate average and percentile times to click
+                stats["avg_time_to_click"] = (
+                    sum(click_times) / len(click_times) if click_times else 0
+                )
+                stats["p50_time_to_click"] = _percentile(click_times, 0.5)
+                stats["p90_time_to_click"] = _percentile(click_times, 0.9)
 
                 # Calculate rates
                 if stats["total_sent"] > 0:
@@ -385,12 +643,56 @@ class SupabaseClient:
             return []
 
     async def create_tracking_table_if_not_exists(self):
-        """Create tracking events table if it doesn't exist"""
+        """Make sure tracking_events has partitions for this month and the next ones"""
         try:
-            # This would typically be done via migrations
-            # For now, we'll just log that we attempted it
-            logger.info("Tracking table creation attempted")
+            await asyncio.to_thread(
+                self.service_client.rpc("ensure_tracking_event_partitions", {}).execute
+            )
             return True
         except Exception as e:
-            logger.error(f"Error creating tracking table: {str(e)}")
+            logger.error(f"Error creating tracking event partitions: {str(e)}")
             return False
+
+    async def insert_tracking_events(self, events: List[Dict[str, Any]]) -> bool:
+        """Append tracking events and add them to the per-minute/hour rollups"""
+        try:
+            await asyncio.to_thread(
+                self.service_client.rpc(
+                    "ingest_tracking_events", {"p_events": events}
+                ).execute
+            )
+            return True
+        except Exception as e:
+            logger.error(f"Error inserting tracking events: {str(e)}")
+            return False
+
+    async def get_campaign_timeline(
+        self,
+        campaign_id: str,
+        bucket_size: str = "hour",
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        department: Optional[str] = None,
+        event_type: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """Rolled-up event counts of a campaign, oldest bucket first"""
+        try:
+            query = (
+                self.service_client.table("tracking_event_rollups")
+                .select("bucket_start, department, event_type, event_count")
+                .eq("campaign_id", campaign_id)
+                .eq("bucket_size", bucket_size)
+            )
+            if since:
+                query = query.gte("bucket_start", since.isoformat())
+            if until:
+                query = query.lt("bucket_start", until.isoformat())
+            if department is not None:
+                query = query.eq("department", department)
+            if event_type:
+                query = query.eq("event_type", event_type)
+            result = await asyncio.to_thread(query.order("bucket_start").execute)
+            return result.data or []
+        except Exception as e:
+            logger.error(f"Error getting campaign timeline: {str(e)}")
+            return []
@@ -1,9 +1,13 @@
 import os
+import hashlib
 import logging
-from typing import Dict, List, Any, Optional
-from jinja2 import Environment, BaseLoader, Template
+from typing import Dict, List, Any, Optional, Iterable, Iterator, Tuple
+from jinja2 import Environment, FunctionLoader, FileSystemBytecodeCache, Template
 from datetime import datetime
 
+from services.bulk_renderer import BulkTemplate
+from utils.html_optimizer import optimize_html
+
 logger = logging.getLogger(__name__)
 
 
@@ -11,7 +15,27 @@ class TemplateService:
     def __init__(self):
         self.templates = self._load_templates()
         self.landing_templates = self._load_landing_templates()
-        self.jinja_env = Environment(loader=BaseLoader())
+
+        # Compiled templates keyed by "<kind>/<template_id>/<content hash>".
+        # The bytecode cache persists compiled code across restarts and is
+        # itself keyed by name and source checksum.
+        self._sources: Dict[str, str] = {}
+        self._compiled: Dict[str, Template] = {}
+        self._bulk: Dict[Tuple[str, str], BulkTemplate] = {}
+        # Email bodies with CSS inlined and whitespace collapsed, keyed by
+        # the hash of the original source
+        self.optimize_html = os.getenv("TEMPLATE_OPTIMIZE_HTML", "true").lower() == "true"
+        self._optimized: Dict[str, str] = {}
+        self.size_report: Dict[Any, Dict[str, Any]] = {}
+        bytecode_dir = os.getenv("TEMPLATE_BYTECODE_CACHE_DIR")
+        if bytecode_dir:
+            os.makedirs(bytecode_dir, exist_ok=True)
+        self.jinja_env = Environment(
+            loader=FunctionLoader(self._sources.get),
+            bytecode_cache=FileSystemBytecodeCache(bytecode_dir or None),
+            auto_reload=False,
+        )
+        self._compile_all()
 
     def get_all_templates(self) -> List[Dict[str, Any]]:
         """Get all available email templates"""
@@ -25,9 +49,61 @@ class TemplateService:
         """Get a specific landing page template by ID"""
         template_str = self.landing_templates.get(template_id)
         if template_str:
-            return self.jinja_env.from_string(template_str)
+            return self.compile_template("landing", template_id, template_str)
         return None
 
+    def compile_template(self, kind: str, template_id: Any, source: str) -> Template:
+        """Return the compiled template for this source, compiling it on first use"""
+        digest = hashlib.sha1(source.encode("utf-8")).hexdigest()[:16]
+        name = f"{kind}/{template_id}/{digest}"
+        compiled = self._compiled.get(name)
+        if compiled is None:
+            self._sources[name] = source
+            compiled = self.jinja_env.get_template(name)
+            self._compiled[name] = compiled
+        return compiled
+
+    def optimized_html(self, template: Dict[str, Any]) -> str:
+        """Return the template's email body with CSS inlined and whitespace collapsed"""
+        source = template["html_content"]
+        if not self.optimize_html:
+            return source
+
+        digest = hashlib.sha1(source.encode("utf-8")).hexdigest()
+        optimized = self._optimized.get(digest)
+        if optimized is None:
+            try:
+                optimized = optimize_html(source)
+            except Exception as e:
+                logger.error(f"Error optimizing template {template.get('template_id')}: {str(e)}")
+                optimized = source
+            self._optimized[digest] = optimized
+
+            original_bytes = len(source.encode("utf-8"))
+            optimized_bytes = len(optimized.encode("utf-8"))
+            self.size_report[template.get("template_id")] = {
+                "original_bytes": original_bytes,
+                "optimized_bytes": optimized_bytes,
+                "saved_percent": round(100 * (1 - optimized_bytes / original_bytes), 1)
+                if original_bytes
+                else 0.0,
+            }
+        return optimized
+
+    def _compile_all(self):
+        """Compile every built-in template up front"""
+        for template_id, template in self.templates.items():
+            self.compile_template("subject", template_id, template["subject"])
+            self.compile_template("html", template_id, self.optimized_html(template))
+        for template_id, source in self.landing_templates.items():
+            self.compile_template("landing", template_id, source)
+        logger.info(f"Compiled {len(self._compiled)} templates")
+        for template_id, report in self.size_report.items():
+            logger.info(
+                f"Template {template_id}: {report['original_bytes']} -> "
+                f"{report['optimized_bytes']} bytes ({report['saved_percent']}% saved)"
+            )
+
     def personalize_template(
         self,
         template: Dict[str, Any],
@@ -37,20 +113,18 @@ class TemplateService:
         """Personalize email content using Jinja2"""
         try:
             # Prepare context for template rendering
-            context = {
-                "employee_name": target.get("name", "there"),
-                "employee_email": target.get("email"),
-                "department": target.get("department", "your department"),
-                "tracking_urls": tracking_urls,
-                "current_time": datetime.utcnow().strftime("%I:%M %p"),
-            }
+            context = self.build_context(target, tracking_urls)
 
             # Render subject
-            subject_template = self.jinja_env.from_string(template["subject"])
+            subject_template = self.compile_template(
+                "subject", template.get("template_id"), template["subject"]
+            )
             personalized_subject = subject_template.render(context)
 
             # Render HTML content
-            html_template = self.jinja_env.from_string(template["html_content"])
+            html_template = self.compile_template(
+                "html", template.get("template_id"), self.optimized_html(template)
+            )
             personalized_html = html_template.render(context)
 
             return {
@@ -65,6 +139,53 @@ class TemplateService:
                 "html": template["html_content"],
             }
 
+    def build_context(
+        self, target: Dict[str, Any], tracking_urls: Dict[str, str]
+    ) -> Dict[str, Any]:
+        """Build the per-recipient personalization context"""
+        return {
+            "employee_name": target.get("name", "there"),
+            "employee_email": target.get("email"),
+            "department": target.get("department", "your department"),
+            "tracking_urls": tracking_urls,
+            "current_time": datetime.utcnow().strftime("%I:%M %p"),
+        }
+
+    def compile_bulk(self, template: Dict[str, Any]) -> BulkTemplate:
+        """Pre-render the static parts of a template for bulk personalization"""
+        html_source = self.optimized_html(template)
+        subject = self.compile_template(
+            "subject", template.get("template_id"), template["subject"]
+        )
+        html = self.compile_template("html", template.get("template_id"), html_source)
+        key = (subject.name, html.name)
+        bulk = self._bulk.get(key)
+        if bulk is None:
+            bulk = BulkTemplate(
+                self.jinja_env, subject, template["subject"], html, html_source
+            )
+            self._bulk[key] = bulk
+        return bulk
+
+    def render_bulk(
+        self,
+        template: Dict[str, Any],
+        recipients: Iterable[Tuple[Dict[str, Any], Dict[str, str]]],
+    ) -> Iterator[Tuple[Dict[str, Any], Dict[str, str]]]:
+        """Lazily personalize a template for (target, tracking_urls) pairs.
+
+        Yields (target, {"subject", "html"}) one recipient at a time, so
+        callers can stream bodies to the sender without holding them all.
+        """
+        bulk = self.compile_bulk(template)
+        for target, tracking_urls in recipients:
+            try:
+                content = bulk.render(self.build_context(target, tracking_urls))
+            except Exception as e:
+                logger.error(f"Error rendering bulk template: {str(e)}")
+                content = self.personalize_template(template, target, tracking_urls)
+            yield target, content
+
     def _load_templates(self) -> Dict[int, Dict[str, Any]]:
         """Load all email templates"""
         return {
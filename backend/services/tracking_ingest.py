@@ -0,0 +1,270 @@
+import os
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, List, NamedTuple, Optional, Set, Tuple
+
+from services.supabase_client import EVENT_STATUSES
+from utils.dedupe_window import DedupeWindow
+from utils.tracking_tokens import TrackingToken, is_legacy_token
+
+logger = logging.getLogger(__name__)
+
+# Column that shows a target already reached a status, and the campaign
+# counter its first transition into that status adds to
+MILESTONES = {
+    "opened": ("opened_at", "total_opened"),
+    "clicked": ("clicked_at", "total_clicked"),
+    "submitted": (None, "total_submitted"),
+    "reported": ("reported_at", "total_reported"),
+}
+
+# Events that mail clients, image proxies, link scanners and page reloads
+# repeat. A landing page visit counts as a click, so it is deduped with them
+DEDUPED_EVENTS = {"opened", "clicked", "landed"}
+
+
+class TrackingEvent(NamedTuple):
+    tracking_id: str
+    event_type: str
+    metadata: Optional[Dict[str, Any]]
+    token: Optional[TrackingToken]
+    occurred_at: datetime
+
+
+class TrackingEventIngest:
+    """Write-behind buffer for tracking events (opens, clicks, visits, ...).
+
+    Tracking endpoints hand events to ``submit`` and respond right away; a
+    background flusher resolves legacy tracking ids in one query per batch,
+    writes the resulting target status transitions as one bulk upsert,
+    counts first-time opens, clicks, etc. into the campaign counters and
+    appends every event to the event log and its time-bucketed rollups.
+    Event log rows that fail to write are retried with the next batch.
+    Repeat opens, clicks and landing page visits of a tracking id within
+    ``dedupe_seconds`` of the first are counted but never reach storage. The buffer holds
+    at most ``max_events``; past that ``submit`` refuses new events so a slow
+    database costs dropped pixels rather than memory.
+    """
+
+    def __init__(self, supabase_client, counters):
+        self.supabase_client = supabase_client
+        self.counters = counters
+        self.max_events = int(os.getenv("TRACKING_INGEST_MAX_EVENTS", 10000))
+        self.max_batch = int(os.getenv("TRACKING_INGEST_BATCH", 500))
+        self.flush_interval = float(os.getenv("TRACKING_INGEST_INTERVAL_MS", 500)) / 1000
+        self.dedupe = DedupeWindow(
+            float(os.getenv("TRACKING_DEDUPE_SECONDS", 300)),
+            int(os.getenv("TRACKING_DEDUPE_MAX_ENTRIES", 100000)),
+        )
+
+        self._events: Deque[TrackingEvent] = deque()
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self._flusher: Optional[asyncio.Task] = None
+        self._closing = False
+        self._unlogged: List[Dict[str, Any]] = []
+        self.raw_hits: Dict[str, int] = {}
+        self.deduped_hits: Dict[str, int] = {}
+        self.accepted = 0
+        self.dropped = 0
+        self.rejected = 0
+        self.unresolved = 0
+        self.flushes = 0
+        self.events_written = 0
+
+    def submit(
+        self,
+        tracking_id: str,
+        event_type: str,
+        metadata: Optional[Dict[str, Any]] = None,
+        token: Optional[TrackingToken] = None,
+    ) -> bool:
+        """Buffer a tracking event; False only if the buffer is full"""
+        if token is None and not is_legacy_token(tracking_id):
+            self.rejected += 1
+            logger.warning(f"Rejected invalid tracking token: {tracking_id}")
+            return True
+
+        self.raw_hits[event_type] = self.raw_hits.get(event_type, 0) + 1
+        if len(self._events) >= self.max_events:
+            if self.dropped % 1000 == 0:
+                logger.warning(
+                    f"Tracking event buffer full ({self.max_events}); dropping events"
+                )
+            self.dropped += 1
+            return False
+
+        # Checked after overflow so a dropped hit does not hide the next one
+        if event_type in DEDUPED_EVENTS and self.dedupe.check((tracking_id, event_type)):
+            self.deduped_hits[event_type] = self.deduped_hits.get(event_type, 0) + 1
+            return True
+
+        self._events.append(
+            TrackingEvent(
+                tracking_id, event_type, metadata, token, datetime.now(timezone.utc)
+            )
+        )
+        self.accepted += 1
+
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._run())
+        if len(self._events) >= self.max_batch:
+            self._wakeup.set()
+        return True
+
+    async def _run(self):
+        while self._events:
+            if not self._closing:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+            while self._events:
+                if not await self.flush():
+                    if self._closing:
+                        return
+                    break
+
+    async def flush(self) -> int:
+        """Write up to one batch of buffered events; returns the number handled"""
+        async with self._flush_lock:
+            if not self._events:
+                return 0
+
+            batch = [
+                self._events.popleft()
+                for _ in range(min(self.max_batch, len(self._events)))
+            ]
+
+            legacy = {e.tracking_id for e in batch if e.token is None}
+            resolved = await self.supabase_client.resolve_tracking_ids(list(legacy))
+            if resolved is None:
+                # Lookup failed, which says nothing about whether the ids exist
+                self._requeue(batch)
+                return 0
+
+            events = []
+            log_rows = []
+            for event in batch:
+                token = event.token or resolved.get(event.tracking_id)
+                if token is None:
+                    self.unresolved += 1
+                    logger.warning(f"No target found for tracking_id: {event.tracking_id}")
+                    continue
+                log_rows.append(
+                    {
+                        "occurred_at": event.occurred_at.isoformat(),
+                        "campaign_id": token.campaign_id,
+                        "target_id": token.target_id,
+                        "tracking_id": event.tracking_id,
+                        "event_type": event.event_type,
+                        "metadata": event.metadata,
+                    }
+                )
+                status = EVENT_STATUSES.get(event.event_type)
+                if status:
+                    events.append((event, token, status))
+
+            milestones = await self.supabase_client.get_target_milestones(
+                list({token.target_id for _, token, _ in events})
+            )
+
+            if milestones is None:
+                for campaign_id in {token.campaign_id for _, token, _ in events}:
+                    self.counters.mark_dirty(campaign_id)
+
+            rows: Dict[str, Dict[str, Any]] = {}
+            reached: Set[Tuple[str, str]] = set()
+            increments: Dict[Tuple[str, str], int] = {}
+            for event, token, status in events:
+                # Only a target's first transition into a status counts; if
+                # its current state is unknown, reconciliation catches up
+                if milestones is not None and (token.target_id, status) not in reached:
+                    reached.add((token.target_id, status))
+                    column, counter = MILESTONES.get(status, (None, None))
+                    current = milestones.get(token.target_id)
+                    if counter and current is not None and not (
+                        current.get(column) if column else current["status"] == status
+                    ):
+                        key = (token.campaign_id, counter)
+                        increments[key] = increments.get(key, 0) + 1
+
+                # Events of a target apply in arrival order, as they would
+                # have one request at a time
+                update = self.supabase_client.build_target_status_update(
+                    status, metadata=event.metadata
+                )
+                rows.setdefault(token.target_id, {"id": token.target_id}).update(update)
+
+            if rows and not await self.supabase_client.bulk_update_target_status(
+                list(rows.values())
+            ):
+                self._requeue(batch)
+                return 0
+
+            for (campaign_id, counter), count in increments.items():
+                self.counters.add(campaign_id, counter, count)
+            await self._log_events(log_rows)
+
+            self.flushes += 1
+            self.events_written += len(batch)
+            return len(batch)
+
+    async def _log_events(self, rows: List[Dict[str, Any]]) -> bool:
+        """Append events to the event log, keeping them for a retry on failure"""
+        rows, self._unlogged = self._unlogged + rows, []
+        if not rows:
+            return True
+        if await self.supabase_client.insert_tracking_events(rows):
+            return True
+        # The status writes already happened, so only the log rows are retried
+        if len(rows) > self.max_events:
+            self.dropped += len(rows) - self.max_events
+            logger.warning(
+                f"Dropping {len(rows) - self.max_events} unlogged tracking events"
+            )
+            rows = rows[-self.max_events:]
+        self._unlogged = rows
+        return False
+
+    def _requeue(self, batch: List[TrackingEvent]):
+        """Put a failed batch back in front of newer events, as far as it fits"""
+        room = max(0, self.max_events - len(self._events))
+        if room < len(batch):
+            self.dropped += len(batch) - room
+            logger.warning(f"Dropping {len(batch) - room} tracking events after failed write")
+        logger.warning(f"Requeueing {min(room, len(batch))} tracking events")
+        self._events.extendleft(reversed(batch[:room]))
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "queued": len(self._events),
+            "unlogged": len(self._unlogged),
+            "max_events": self.max_events,
+            "accepted": self.accepted,
+            "raw_hits": dict(self.raw_hits),
+            "deduped_hits": dict(self.deduped_hits),
+            "dedupe": self.dedupe.metrics(),
+            "dropped": self.dropped,
+            "rejected": self.rejected,
+            "unresolved": self.unresolved,
+            "flushes": self.flushes,
+            "events_written": self.events_written,
+        }
+
+    async def close(self):
+        """Drain the buffer, giving up after the first failed write"""
+        self._closing = True
+        self._wakeup.set()
+        if self._flusher and not self._flusher.done():
+            await self._flusher
+        elif self._events:
+            while self._events and await self.flush():
+                pass
+        if self._events:
+            logger.error(f"Lost {len(self._events)} tracking events on shutdown")
+        if self._unlogged and not await self._log_events([]):
+            logger.error(f"Lost {len(self._unlogged)} event log rows on shutdown")
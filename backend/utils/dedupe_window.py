@@ -0,0 +1,48 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable
+
+
+class DedupeWindow:
+    """Remembers keys for ``window_seconds`` after they are first seen.
+
+    Entries are kept in first-seen order, so expired ones are always at
+    the front and pruning costs only what it removes. At most
+    ``max_entries`` keys are held; past that the oldest are forgotten
+    early, which can only let a repeat through, never drop a first hit.
+    """
+
+    def __init__(self, window_seconds: float, max_entries: int):
+        self.window_seconds = window_seconds
+        self.max_entries = max_entries
+        self._seen: "OrderedDict[Hashable, float]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def _prune(self, now: float):
+        cutoff = now - self.window_seconds
+        while self._seen:
+            key, first_seen = next(iter(self._seen.items()))
+            if first_seen > cutoff and len(self._seen) <= self.max_entries:
+                break
+            self._seen.popitem(last=False)
+
+    def check(self, key: Hashable) -> bool:
+        """True if ``key`` was already seen in the window; records it if not"""
+        if self.window_seconds <= 0 or self.max_entries <= 0:
+            return False
+        now = time.monotonic()
+        self._prune(now)
+        if key in self._seen:
+            return True
+        self._seen[key] = now
+        self._prune(now)
+        return False
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._seen),
+            "max_entries": self.max_entries,
+            "window_seconds": self.window_seconds,
+        }
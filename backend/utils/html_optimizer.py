@@ -0,0 +1,283 @@
+import re
+from html.parser import HTMLParser
+from typing import Dict, List, Optional, Tuple
+
+# Elements around which whitespace-only text never renders
+BLOCK_TAGS = {
+    "html", "head", "body", "title", "meta", "link", "style", "div", "p", "table",
+    "thead", "tbody", "tr", "td", "th", "ul", "ol", "li", "h1", "h2", "h3", "h4",
+    "h5", "h6", "hr", "br", "center", "form", "blockquote",
+}
+VOID_TAGS = {
+    "area", "base", "br", "col", "hr", "img", "input", "link", "meta", "source", "wbr",
+}
+PRESERVE_TAGS = {"pre", "textarea", "script"}
+
+_COMMENT = re.compile(r"/\*.*?\*/", re.S)
+_COMPOUND = re.compile(r"^([a-zA-Z][\w-]*)?((?:[.#][\w-]+)*)$")
+_WHITESPACE = re.compile(r"\s+")
+
+
+class _Rule:
+    def __init__(
+        self,
+        selector: List[Tuple],
+        specificity: Tuple[int, int, int],
+        order: int,
+        declarations: List[Tuple[str, str]],
+    ):
+        self.selector = selector
+        self.specificity = specificity
+        self.order = order
+        self.declarations = declarations
+
+
+def _parse_declarations(text: str) -> List[Tuple[str, str]]:
+    declarations = []
+    for declaration in text.split(";"):
+        name, _, value = declaration.partition(":")
+        name, value = name.strip().lower(), value.strip()
+        if name and value:
+            declarations.append((name, value))
+    return declarations
+
+
+def _parse_compound(text: str) -> Optional[Tuple]:
+    match = _COMPOUND.match(text)
+    if not match or not text:
+        return None
+    tag = (match.group(1) or "").lower() or None
+    parts = re.findall(r"[.#][\w-]+", match.group(2))
+    ids = {p[1:] for p in parts if p[0] == "#"}
+    classes = {p[1:] for p in parts if p[0] == "."}
+    return tag, ids, classes
+
+
+def parse_stylesheet(css: str) -> Tuple[List[_Rule], str]:
+    """Split a stylesheet into inlinable rules and the CSS that must stay.
+
+    Rules whose selectors are tags, classes and ids joined by descendant
+    combinators can be inlined. At-rules (e.g. @media) and anything with
+    pseudo-classes or other combinators are returned as kept CSS.
+    """
+    css = _COMMENT.sub("", css)
+    rules: List[_Rule] = []
+    kept: List[str] = []
+    position = 0
+    while True:
+        start = css.find("{", position)
+        if start < 0:
+            break
+        prelude = css[position:start].strip()
+
+        # Find the matching brace so nested at-rule blocks stay whole
+        depth, end = 0, start
+        while end < len(css):
+            if css[end] == "{":
+                depth += 1
+            elif css[end] == "}":
+                depth -= 1
+                if depth == 0:
+                    break
+            end += 1
+        body = css[start + 1:end]
+        position = end + 1
+
+        if prelude.startswith("@"):
+            kept.append(f"{prelude}{{{body.strip()}}}")
+            continue
+
+        declarations = _parse_declarations(body)
+        for selector_text in prelude.split(","):
+            selector = [_parse_compound(part) for part in selector_text.split()]
+            if not selector or any(part is None for part in selector):
+                kept.append(f"{selector_text.strip()}{{{body.strip()}}}")
+                continue
+            specificity = (
+                sum(len(p[1]) for p in selector),
+                sum(len(p[2]) for p in selector),
+                sum(1 for p in selector if p[0]),
+            )
+            rules.append(_Rule(selector, specificity, len(rules), declarations))
+
+    return rules, "".join(kept)
+
+
+def _matches(compound: Tuple, tag: str, attrs: Dict[str, str]) -> bool:
+    name, ids, classes = compound
+    if name and name != tag:
+        return False
+    if ids and attrs.get("id") not in ids:
+        return False
+    if classes and not classes <= set((attrs.get("class") or "").split()):
+        return False
+    return True
+
+
+def _selector_matches(
+    selector: List[Tuple], stack: List[Tuple[str, Dict[str, str]]]
+) -> bool:
+    tag, attrs = stack[-1]
+    if not _matches(selector[-1], tag, attrs):
+        return False
+    # Descendant combinators only, so matching ancestors greedily is exact
+    index = len(stack) - 2
+    for compound in reversed(selector[:-1]):
+        while index >= 0 and not _matches(compound, *stack[index]):
+            index -= 1
+        if index < 0:
+            return False
+        index -= 1
+    return True
+
+
+def _quote(value: str) -> str:
+    value = value.replace("&", "&amp;")
+    if '"' in value and "'" not in value:
+        return f"'{value}'"
+    return '"' + value.replace('"', "&quot;") + '"'
+
+
+class _Optimizer(HTMLParser):
+    def __init__(self, inline_css: bool):
+        super().__init__(convert_charrefs=False)
+        self.inline_css = inline_css
+        self.rules: List[_Rule] = []
+        self.tokens: List[Tuple[str, str, str]] = []
+        self.stack: List[Tuple[str, Dict[str, str]]] = []
+        self.style_depth = 0
+        self.style_text: List[str] = []
+        self.kept_css = ""
+        self.preserve_depth = 0
+
+    def _emit(self, kind: str, text: str, tag: str = ""):
+        self.tokens.append((kind, text, tag))
+
+    def _start(self, tag: str, attrs: List[Tuple[str, Optional[str]]], closed: bool):
+        if tag == "style" and self.inline_css:
+            self.style_depth += 1
+            self.style_text = []
+            return
+
+        attr_map = {name: value or "" for name, value in attrs}
+        if tag not in VOID_TAGS and not closed:
+            self.stack.append((tag, attr_map))
+            stack = self.stack
+        else:
+            stack = self.stack + [(tag, attr_map)]
+
+        matched = [r for r in self.rules if _selector_matches(r.selector, stack)]
+        classes = attr_map.get("class", "").split()
+        # Classes only the inlined rules used are dead weight once inlined
+        used = classes
+        if self.inline_css:
+            used = [c for c in classes if f".{c}" in self.kept_css]
+        if not matched and used == classes:
+            text = self.get_starttag_text()
+        else:
+            style: Dict[str, str] = {}
+            for rule in sorted(matched, key=lambda r: (r.specificity, r.order)):
+                style.update(rule.declarations)
+            # Styles already inline win over stylesheet rules
+            style.update(_parse_declarations(attr_map.get("style", "")))
+
+            parts = [tag]
+            for name, value in attrs:
+                if name == "style" or name == "class":
+                    continue
+                parts.append(name if value is None else f"{name}={_quote(value)}")
+            if used:
+                parts.append(f"class={_quote(' '.join(used))}")
+            if style:
+                parts.append(
+                    "style=" + _quote(";".join(f"{k}:{v}" for k, v in style.items()))
+                )
+            text = "<" + " ".join(parts) + ("/>" if closed else ">")
+
+        if tag in PRESERVE_TAGS:
+            self.preserve_depth += 1
+        self._emit("tag", text, tag)
+
+    def handle_starttag(self, tag, attrs):
+        self._start(tag, attrs, closed=False)
+
+    def handle_startendtag(self, tag, attrs):
+        self._start(tag, attrs, closed=True)
+
+    def handle_endtag(self, tag):
+        if tag == "style" and self.style_depth:
+            self.style_depth -= 1
+            rules, kept = parse_stylesheet("".join(self.style_text))
+            self.rules.extend(rules)
+            self.kept_css += kept
+            if kept:
+                # Rules mail clients cannot get inline (e.g. @media) stay in <style>
+                self._emit("tag", "<style>", "style")
+                self._emit("raw", _WHITESPACE.sub(" ", kept))
+                self._emit("tag", "</style>", "style")
+            return
+
+        for index in range(len(self.stack) - 1, -1, -1):
+            if self.stack[index][0] == tag:
+                del self.stack[index:]
+                break
+        if tag in PRESERVE_TAGS and self.preserve_depth:
+            self.preserve_depth -= 1
+        self._emit("tag", f"</{tag}>", tag)
+
+    def handle_data(self, data):
+        if self.style_depth:
+            self.style_text.append(data)
+        elif self.preserve_depth:
+            self._emit("raw", data)
+        else:
+            self._emit("text", _WHITESPACE.sub(" ", data))
+
+    def handle_entityref(self, name):
+        self._emit("raw", f"&{name};")
+
+    def handle_charref(self, name):
+        self._emit("raw", f"&#{name};")
+
+    def handle_comment(self, data):
+        # Conditional comments carry Outlook-specific markup
+        if data.startswith("[if") or data.startswith("<![endif"):
+            self._emit("raw", f"<!--{data}-->")
+
+    def handle_decl(self, decl):
+        self._emit("raw", f"<!{decl}>")
+
+    def handle_pi(self, data):
+        self._emit("raw", f"<?{data}>")
+
+    def unknown_decl(self, data):
+        self._emit("raw", f"<![{data}]>")
+
+    def output(self) -> str:
+        out = []
+        for index, (kind, text, tag) in enumerate(self.tokens):
+            if kind == "text" and not text.strip():
+                before = self.tokens[index - 1] if index else None
+                after = self.tokens[index + 1] if index + 1 < len(self.tokens) else None
+                # Whitespace next to a block element or the doctype never renders
+                if (
+                    before is None
+                    or after is None
+                    or before[0] == "raw" and before[1].startswith("<!")
+                    or before[2] in BLOCK_TAGS
+                    or after[2] in BLOCK_TAGS
+                ):
+                    continue
+            out.append(text)
+        return "".join(out).strip()
+
+
+def optimize_html(html: str, inline_css: bool = True) -> str:
+    """Inline ``<style>`` rules into elements, drop comments and collapse whitespace.
+
+    Jinja expressions pass through untouched as text or attribute values.
+    """
+    parser = _Optimizer(inline_css)
+    parser.feed(html)
+    parser.close()
+    return parser.output()
@@ -0,0 +1,211 @@
+import asyncio
+import time
+from typing import Any, Dict, Optional
+
+
+class TokenBucket:
+    """Async token-bucket rate limiter shared by concurrent senders"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    @property
+    def tokens(self) -> float:
+        self._refill()
+        return self._tokens
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        """Take tokens without waiting; return False if not enough are available"""
+        self._refill()
+        if self._tokens >= tokens:
+            self._tokens -= tokens
+            return True
+        return False
+
+    async def acquire(self, tokens: float = 1.0):
+        """Wait until tokens are available, serving waiters in FIFO order"""
+        async with self._lock:
+            while not self.try_acquire(tokens):
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+
+    def drain(self):
+        """Drop all accrued tokens so no burst follows a slowdown"""
+        self._refill()
+        self._tokens = 0.0
+
+    def set_rate(self, rate: float, capacity: Optional[float] = None):
+        """Change the refill rate, keeping tokens accrued at the old rate"""
+        self._refill()
+        self.rate = rate
+        if capacity is not None:
+            self.capacity = capacity
+        self._tokens = min(self._tokens, self.capacity)
+
+
+class AIMDController:
+    """Adaptive send rate and concurrency with additive increase and
+    multiplicative decrease.
+
+    Every successful request grows the rate by ``increase / rate`` (about
+    ``increase`` per second of sending, by default a tenth of the starting
+    rate) and the concurrency limit by ``1 / concurrency``. A 429 cuts the
+    rate by ``decrease``. Overload - an average latency above
+    ``latency_target``, or 5xx and transport errors on more than
+    ``error_threshold`` of recent requests - cuts both the rate and the
+    concurrency. Cuts happen at most once per ``cooldown`` so one burst of
+    errors counts as one signal. A ``Retry-After`` pauses all senders
+    until it has passed.
+    """
+
+    def __init__(
+        self,
+        bucket: TokenBucket,
+        max_concurrency: int,
+        min_rate: float = 1.0,
+        max_rate: Optional[float] = None,
+        increase: Optional[float] = None,
+        decrease: float = 0.5,
+        latency_target: Optional[float] = None,
+        error_threshold: float = 0.05,
+        cooldown: float = 1.0,
+        throttle_backoff: float = 1.0,
+    ):
+        self.bucket = bucket
+        self.min_rate = min_rate
+        self.max_rate = max_rate or bucket.rate * 10
+        self.max_concurrency = max_concurrency
+        self.increase = increase or max(1.0, bucket.rate / 10)
+        self.decrease = decrease
+        self.latency_target = latency_target
+        self.error_threshold = error_threshold
+        self.cooldown = cooldown
+        self.throttle_backoff = throttle_backoff
+
+        self.concurrency = float(max_concurrency)
+        self.in_flight = 0
+        self.latency: Optional[float] = None
+        self.error_ratio = 0.0
+        self.backoff_until = 0.0
+        self._last_decrease = 0.0
+        self._slots = asyncio.Condition()
+
+        self.successes = 0
+        self.throttled = 0
+        self.server_errors = 0
+        self.decreases = 0
+
+    @property
+    def rate(self) -> float:
+        return self.bucket.rate
+
+    def _has_slot(self) -> bool:
+        return self.in_flight < max(1, int(self.concurrency))
+
+    async def acquire(self):
+        """Wait for a concurrency slot, any active backoff and a rate token"""
+        async with self._slots:
+            await self._slots.wait_for(self._has_slot)
+            self.in_flight += 1
+
+        try:
+            while True:
+                delay = self.backoff_until - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                await self.bucket.acquire()
+                # A throttle may have arrived while waiting for the token
+                if self.backoff_until <= time.monotonic():
+                    return
+        except BaseException:
+            async with self._slots:
+                self.in_flight -= 1
+                self._slots.notify_all()
+            raise
+
+    async def release(
+        self,
+        latency: float,
+        status_code: Optional[int] = None,
+        retry_after: Optional[float] = None,
+        error: bool = False,
+    ):
+        """Free the slot taken by ``acquire`` and feed back the outcome.
+
+        ``error`` marks a failed request; its ``status_code`` is None for
+        transport errors.
+        """
+        now = time.monotonic()
+        server_error = error and (status_code is None or status_code >= 500)
+        self.error_ratio = 0.99 * self.error_ratio + (0.01 if server_error else 0.0)
+
+        if not error:
+            self.successes += 1
+            self.latency = (
+                latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+            )
+            if self.latency_target and self.latency > self.latency_target:
+                self._decrease(now, concurrency=True)
+            else:
+                self._increase()
+        elif status_code == 429:
+            self.throttled += 1
+            self.backoff_until = max(
+                self.backoff_until,
+                now + (retry_after if retry_after is not None else self.throttle_backoff),
+            )
+            # Throttling is about the rate; requests in flight are not the problem
+            self._decrease(now, concurrency=False)
+        elif server_error:
+            self.server_errors += 1
+            if retry_after is not None:
+                self.backoff_until = max(self.backoff_until, now + retry_after)
+            # Occasional errors are noise; a rising share of them is overload
+            if self.error_ratio > self.error_threshold:
+                self._decrease(now, concurrency=True)
+
+        async with self._slots:
+            self.in_flight -= 1
+            self._slots.notify_all()
+
+    def _increase(self):
+        rate = min(self.max_rate, self.rate + self.increase / max(self.rate, 1.0))
+        if rate != self.rate:
+            self.bucket.set_rate(rate)
+        self.concurrency = min(
+            float(self.max_concurrency), self.concurrency + 1.0 / self.concurrency
+        )
+
+    def _decrease(self, now: float, concurrency: bool):
+        if now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self.decreases += 1
+        self.bucket.set_rate(max(self.min_rate, self.rate * self.decrease))
+        self.bucket.drain()
+        if concurrency:
+            self.concurrency = max(1.0, self.concurrency * self.decrease)
+
+    def metrics(self) -> Dict[str, Any]:
+        return {
+            "rate": round(self.rate, 3),
+            "concurrency": int(self.concurrency),
+            "in_flight": self.in_flight,
+            "latency_ms": round(self.latency * 1000, 1) if self.latency else None,
+            "error_ratio": round(self.error_ratio, 4),
+            "backoff_seconds": round(max(0.0, self.backoff_until - time.monotonic()), 3),
+            "successes": self.successes,
+            "throttled": self.throttled,
+            "server_errors": self.server_errors,
+            "decreases": self.decreases,
+        }
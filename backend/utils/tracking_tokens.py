@@ -0,0 +1,144 @@
+import os
+import hmac
+import uuid
+import base64
+import hashlib
+import logging
+from typing import Dict, NamedTuple, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+TOKEN_VERSION = 1
+MAC_BYTES = 12
+
+
+class TrackingToken(NamedTuple):
+    target_id: str
+    campaign_id: str
+
+
+def _b64encode(data: bytes) -> str:
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode("ascii")
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4))
+
+
+def _pack_id(value: str) -> bytes:
+    """UUIDs pack into 16 bytes behind a 0 tag; other ids into a length-prefixed string"""
+    try:
+        return b"\x00" + uuid.UUID(value).bytes
+    except ValueError:
+        raw = value.encode("utf-8")
+        if not 0 < len(raw) < 256:
+            raise ValueError(f"Cannot encode id of {len(raw)} bytes in a tracking token")
+        return bytes([len(raw)]) + raw
+
+
+def _unpack_id(data: bytes, offset: int) -> Tuple[str, int]:
+    tag = data[offset]
+    if tag == 0:
+        end = offset + 17
+        if end > len(data):
+            raise ValueError("truncated id")
+        return str(uuid.UUID(bytes=data[offset + 1:end])), end
+    end = offset + 1 + tag
+    if end > len(data):
+        raise ValueError("truncated id")
+    return data[offset + 1:end].decode("utf-8"), end
+
+
+def is_legacy_token(token: str) -> bool:
+    """True for the random uuid4 tracking ids sent before signed tokens"""
+    try:
+        uuid.UUID(token)
+        return True
+    except ValueError:
+        return False
+
+
+class TrackingTokenCodec:
+    """Stateless HMAC-signed tracking tokens carrying target and campaign ids.
+
+    A token is the base64url encoding of a version byte, a key id byte, the
+    packed target and campaign ids and a truncated HMAC-SHA256 over all of
+    it, so tracking endpoints can resolve a hit without a database read.
+    New tokens are signed with the first key; any configured key verifies,
+    so keys can be rotated by adding a new one in front and dropping the
+    old one once its emails are no longer expected to be opened.
+    """
+
+    def __init__(self, keys: Dict[int, bytes], signing_key_id: Optional[int] = None):
+        self.keys = keys
+        if signing_key_id is None and keys:
+            signing_key_id = next(iter(keys))
+        self.signing_key_id = signing_key_id
+
+    @classmethod
+    def from_env(cls) -> "TrackingTokenCodec":
+        """Load keys from TRACKING_TOKEN_KEYS, e.g. "2:new-secret,1:old-secret"
+
+        The first key signs new tokens. Without keys, tokens are disabled
+        and callers fall back to random tracking ids.
+        """
+        keys: Dict[int, bytes] = {}
+        for entry in os.getenv("TRACKING_TOKEN_KEYS", "").split(","):
+            key_id, _, secret = entry.strip().partition(":")
+            if not secret:
+                continue
+            try:
+                kid = int(key_id)
+            except ValueError:
+                logger.error(f"Ignoring tracking token key with invalid id: {key_id!r}")
+                continue
+            if not 0 <= kid < 256:
+                logger.error(f"Ignoring tracking token key id out of range: {kid}")
+                continue
+            keys[kid] = secret.encode("utf-8")
+        if not keys:
+            logger.warning("TRACKING_TOKEN_KEYS not set; using random tracking ids")
+        return cls(keys)
+
+    @property
+    def enabled(self) -> bool:
+        return self.signing_key_id is not None
+
+    def _mac(self, key: bytes, payload: bytes) -> bytes:
+        return hmac.new(key, payload, hashlib.sha256).digest()[:MAC_BYTES]
+
+    def encode(self, target_id: str, campaign_id: str) -> str:
+        """Sign a token for a target of a campaign"""
+        if not self.enabled:
+            raise ValueError("No tracking token signing key configured")
+        payload = (
+            bytes([TOKEN_VERSION, self.signing_key_id])
+            + _pack_id(str(target_id))
+            + _pack_id(str(campaign_id))
+        )
+        return _b64encode(payload + self._mac(self.keys[self.signing_key_id], payload))
+
+    def decode(self, token: str) -> Optional[TrackingToken]:
+        """Verify a token and return its ids; None if it is not a valid signed token"""
+        try:
+            data = _b64decode(token)
+        except (ValueError, TypeError):
+            return None
+        if len(data) < 2 + MAC_BYTES or data[0] != TOKEN_VERSION:
+            return None
+
+        key = self.keys.get(data[1])
+        if key is None:
+            return None
+        payload, mac = data[:-MAC_BYTES], data[-MAC_BYTES:]
+        if not hmac.compare_digest(mac, self._mac(key, payload)):
+            return None
+
+        try:
+            target_id, offset = _unpack_id(payload, 2)
+            campaign_id, offset = _unpack_id(payload, offset)
+        except (ValueError, IndexError, UnicodeDecodeError):
+            return None
+        if offset != len(payload):
+            return None
+        return TrackingToken(target_id, campaign_id)
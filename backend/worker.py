@@ -0,0 +1,50 @@
+import asyncio
+import logging
+import signal
+from dotenv import load_dotenv
+
+from services.supabase_client import SupabaseClient
+from services.email_service import EmailService
+from services.template_service import TemplateService
+from services.campaign_sender import CampaignSender
+from services.send_queue import SendQueue
+from services.queue_worker import SendQueueWorker
+
+# Load environment variables
+load_dotenv()
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+async def main():
+    """Run a standalone campaign send worker against the shared send queue"""
+    supabase_client = SupabaseClient()
+    email_service = EmailService()
+    template_service = TemplateService()
+    campaign_sender = CampaignSender(email_service, template_service, supabase_client)
+    send_queue = SendQueue()
+    worker = SendQueueWorker(
+        send_queue, campaign_sender, template_service, supabase_client
+    )
+
+    await supabase_client.initialize()
+    await email_service.initialize()
+    send_queue.initialize()
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, worker.stop)
+
+    try:
+        await worker.run()
+    finally:
+        send_queue.close()
+        await campaign_sender.status_writer.close()
+        await campaign_sender.counters.close()
+        await email_service.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
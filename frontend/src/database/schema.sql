@@ -220,3 +220,285 @@ SELECT
         ELSE 0
     END as overall_report_rate
 FROM campaigns;
+
+-- Campaign of each target employee, copied from its campaign target so
+-- a campaign's pending targets can be paged through one index
+ALTER TABLE campaign_target_employees
+    ADD COLUMN IF NOT EXISTS campaign_id UUID REFERENCES campaigns(id) ON DELETE CASCADE;
+
+UPDATE campaign_target_employees cte
+SET campaign_id = ct.campaign_id
+FROM campaign_targets ct
+WHERE ct.id = cte.campaign_target_id AND cte.campaign_id IS NULL;
+
+CREATE OR REPLACE FUNCTION set_campaign_target_employee_campaign()
+RETURNS TRIGGER AS $$
+BEGIN
+    SELECT campaign_id INTO NEW.campaign_id
+    FROM campaign_targets WHERE id = NEW.campaign_target_id;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS set_campaign_target_employee_campaign ON campaign_target_employees;
+CREATE TRIGGER set_campaign_target_employee_campaign
+    BEFORE INSERT OR UPDATE OF campaign_target_id ON campaign_target_employees
+    FOR EACH ROW EXECUTE FUNCTION set_campaign_target_employee_campaign();
+
+-- Pending targets of a campaign in id order, for keyset pagination
+DROP INDEX IF EXISTS idx_campaign_target_employees_target_status_id;
+CREATE INDEX IF NOT EXISTS idx_campaign_target_employees_campaign_pending
+    ON campaign_target_employees(campaign_id, id) WHERE status = 'pending';
+
+-- Flat view of campaign target employees for streaming sends: one row per
+-- target, paged with keyset pagination on id
+CREATE OR REPLACE VIEW campaign_target_queue AS
+SELECT
+    cte.id,
+    cte.status,
+    cte.campaign_target_id,
+    cte.campaign_id,
+    cte.employee_id,
+    e.name,
+    e.email,
+    e.department
+FROM campaign_target_employees cte
+JOIN employees e ON e.id = cte.employee_id;
+
+-- Incrementally maintained campaign totals
+ALTER TABLE campaigns ADD COLUMN IF NOT EXISTS total_submitted INTEGER DEFAULT 0;
+ALTER TABLE campaigns ADD COLUMN IF NOT EXISTS total_failed INTEGER DEFAULT 0;
+
+ALTER TABLE campaign_target_employees
+    DROP CONSTRAINT IF EXISTS campaign_target_employees_status_check;
+ALTER TABLE campaign_target_employees
+    ADD CONSTRAINT campaign_target_employees_status_check
+    CHECK (status IN ('pending', 'sent', 'opened', 'clicked', 'submitted', 'reported', 'failed'));
+
+-- Add counter deltas to a campaign in one atomic update, e.g.
+-- SELECT increment_campaign_stats(id, '{"total_clicked": 3}');
+CREATE OR REPLACE FUNCTION increment_campaign_stats(p_campaign_id UUID, p_deltas JSONB)
+RETURNS VOID AS $$
+BEGIN
+    UPDATE campaigns SET
+        total_sent = COALESCE(total_sent, 0) + COALESCE((p_deltas->>'total_sent')::INTEGER, 0),
+        total_opened = COALESCE(total_opened, 0) + COALESCE((p_deltas->>'total_opened')::INTEGER, 0),
+        total_clicked = COALESCE(total_clicked, 0) + COALESCE((p_deltas->>'total_clicked')::INTEGER, 0),
+        total_submitted = COALESCE(total_submitted, 0) + COALESCE((p_deltas->>'total_submitted')::INTEGER, 0),
+        total_reported = COALESCE(total_reported, 0) + COALESCE((p_deltas->>'total_reported')::INTEGER, 0),
+        total_failed = COALESCE(total_failed, 0) + COALESCE((p_deltas->>'total_failed')::INTEGER, 0)
+    WHERE id = p_campaign_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Per-campaign stats aggregated in the database: one row of totals, rates
+-- and time-to-click (seconds) figures, or no row if the campaign does not exist
+CREATE OR REPLACE FUNCTION campaign_stats_summary(p_campaign_id UUID)
+RETURNS TABLE (
+    total_targets BIGINT,
+    total_sent BIGINT,
+    total_opened BIGINT,
+    total_clicked BIGINT,
+    total_submitted BIGINT,
+    total_reported BIGINT,
+    total_failed BIGINT,
+    open_rate DOUBLE PRECISION,
+    click_rate DOUBLE PRECISION,
+    submit_rate DOUBLE PRECISION,
+    report_rate DOUBLE PRECISION,
+    avg_time_to_click DOUBLE PRECISION,
+    p50_time_to_click DOUBLE PRECISION,
+    p90_time_to_click DOUBLE PRECISION
+) AS $$
+    WITH targets AS (
+        SELECT
+            cte.status,
+            cte.sent_at,
+            cte.opened_at,
+            cte.clicked_at,
+            cte.reported_at,
+            EXTRACT(EPOCH FROM cte.clicked_at - cte.sent_at)::DOUBLE PRECISION AS time_to_click
+        FROM campaign_target_employees cte
+        JOIN campaign_targets ct ON ct.id = cte.campaign_target_id
+        WHERE ct.campaign_id = p_campaign_id
+    ),
+    totals AS (
+        SELECT
+            COUNT(*) AS total_targets,
+            COUNT(*) FILTER (WHERE status = 'sent' OR sent_at IS NOT NULL) AS total_sent,
+            COUNT(*) FILTER (WHERE status = 'opened' OR opened_at IS NOT NULL) AS total_opened,
+            COUNT(*) FILTER (WHERE status = 'clicked' OR clicked_at IS NOT NULL) AS total_clicked,
+            COUNT(*) FILTER (WHERE status = 'submitted') AS total_submitted,
+            COUNT(*) FILTER (WHERE status = 'reported' OR reported_at IS NOT NULL) AS total_reported,
+            COUNT(*) FILTER (WHERE status = 'failed') AS total_failed,
+            COALESCE(AVG(time_to_click), 0) AS avg_time_to_click,
+            COALESCE(PERCENTILE_CONT(0.5) WITHIN GROUP (ORDER BY time_to_click), 0) AS p50_time_to_click,
+            COALESCE(PERCENTILE_CONT(0.9) WITHIN GROUP (ORDER BY time_to_click), 0) AS p90_time_to_click
+        FROM targets
+        HAVING EXISTS (SELECT 1 FROM campaigns WHERE id = p_campaign_id)
+    )
+    SELECT
+        total_targets,
+        total_sent,
+        total_opened,
+        total_clicked,
+        total_submitted,
+        total_reported,
+        total_failed,
+        (CASE WHEN total_sent > 0 THEN total_opened * 100.0 / total_sent ELSE 0 END)::DOUBLE PRECISION,
+        (CASE WHEN total_sent > 0 THEN total_clicked * 100.0 / total_sent ELSE 0 END)::DOUBLE PRECISION,
+        (CASE WHEN total_sent > 0 THEN total_submitted * 100.0 / total_sent ELSE 0 END)::DOUBLE PRECISION,
+        (CASE WHEN total_sent > 0 THEN total_reported * 100.0 / total_sent ELSE 0 END)::DOUBLE PRECISION,
+        avg_time_to_click,
+        p50_time_to_click,
+        p90_time_to_click
+    FROM totals;
+$$ LANGUAGE sql STABLE;
+
+-- Append-only log of every tracking event (repeat opens included),
+-- partitioned by month so old months can be detached or dropped whole
+CREATE TABLE IF NOT EXISTS tracking_events (
+    id BIGINT GENERATED ALWAYS AS IDENTITY,
+    occurred_at TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    campaign_id UUID NOT NULL,
+    target_id UUID,
+    tracking_id TEXT,
+    department VARCHAR(255),
+    event_type VARCHAR(32) NOT NULL,
+    metadata JSONB,
+    PRIMARY KEY (id, occurred_at)
+) PARTITION BY RANGE (occurred_at);
+
+CREATE TABLE IF NOT EXISTS tracking_events_default
+    PARTITION OF tracking_events DEFAULT;
+
+CREATE INDEX IF NOT EXISTS idx_tracking_events_campaign_time
+    ON tracking_events(campaign_id, occurred_at);
+CREATE INDEX IF NOT EXISTS idx_tracking_events_target
+    ON tracking_events(target_id);
+
+-- Create the monthly partitions of tracking_events from this month on.
+-- Rows that landed in the default partition because their month had no
+-- partition yet are moved into the new one, since a partition cannot be
+-- attached while the default holds rows in its range. Run daily by the
+-- backend (and by pg_cron where it is installed).
+CREATE OR REPLACE FUNCTION ensure_tracking_event_partitions(p_months_ahead INTEGER DEFAULT 2)
+RETURNS VOID AS $$
+DECLARE
+    month_start DATE;
+    month_end DATE;
+    partition_name TEXT;
+BEGIN
+    -- One maintenance run at a time
+    PERFORM pg_advisory_xact_lock(hashtext('ensure_tracking_event_partitions'));
+
+    FOR i IN 0..p_months_ahead LOOP
+        month_start := (DATE_TRUNC('month', NOW()) + (i || ' months')::INTERVAL)::DATE;
+        month_end := (month_start + INTERVAL '1 month')::DATE;
+        partition_name := 'tracking_events_' || TO_CHAR(month_start, 'YYYY_MM');
+        CONTINUE WHEN TO_REGCLASS(partition_name) IS NOT NULL;
+
+        -- Hold off inserts into the default partition until the move is done
+        LOCK TABLE tracking_events_default IN EXCLUSIVE MODE;
+        EXECUTE FORMAT(
+            'CREATE TABLE %I (LIKE tracking_events INCLUDING DEFAULTS INCLUDING CONSTRAINTS)',
+            partition_name
+        );
+        EXECUTE FORMAT(
+            'WITH moved AS (
+                 DELETE FROM tracking_events_default
+                 WHERE occurred_at >= %L AND occurred_at < %L
+                 RETURNING *
+             )
+             INSERT INTO %I SELECT * FROM moved',
+            month_start, month_end, partition_name
+        );
+        EXECUTE FORMAT(
+            'ALTER TABLE tracking_events ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+            partition_name, month_start, month_end
+        );
+    END LOOP;
+END;
+$$ LANGUAGE plpgsql;
+
+SELECT ensure_tracking_event_partitions();
+
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_cron') THEN
+        PERFORM cron.schedule(
+            'ensure-tracking-event-partitions',
+            '0 3 * * *',
+            'SELECT ensure_tracking_event_partitions()'
+        );
+    END IF;
+END;
+$$;
+
+-- Event counts per minute and per hour by campaign, department and event
+-- type, kept up to date by ingest_tracking_events
+CREATE TABLE IF NOT EXISTS tracking_event_rollups (
+    bucket_size VARCHAR(10) NOT NULL CHECK (bucket_size IN ('minute', 'hour')),
+    bucket_start TIMESTAMP WITH TIME ZONE NOT NULL,
+    campaign_id UUID NOT NULL,
+    department VARCHAR(255) NOT NULL DEFAULT '',
+    event_type VARCHAR(32) NOT NULL,
+    event_count BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (campaign_id, bucket_size, bucket_start, department, event_type)
+);
+
+-- Append a batch of events and add them to the rollups in one statement.
+-- p_events is a JSON array of {occurred_at, campaign_id, target_id,
+-- tracking_id, event_type, metadata}; departments come from the targets.
+CREATE OR REPLACE FUNCTION ingest_tracking_events(p_events JSONB)
+RETURNS INTEGER AS $$
+    WITH inserted AS (
+        INSERT INTO tracking_events (
+            occurred_at, campaign_id, target_id, tracking_id, department, event_type, metadata
+        )
+        SELECT
+            e.occurred_at,
+            e.campaign_id,
+            e.target_id,
+            e.tracking_id,
+            ct.department,
+            e.event_type,
+            e.metadata
+        FROM JSONB_TO_RECORDSET(p_events) AS e(
+            occurred_at TIMESTAMP WITH TIME ZONE,
+            campaign_id UUID,
+            target_id UUID,
+            tracking_id TEXT,
+            event_type VARCHAR(32),
+            metadata JSONB
+        )
+        LEFT JOIN campaign_target_employees cte ON cte.id = e.target_id
+        LEFT JOIN campaign_targets ct ON ct.id = cte.campaign_target_id
+        RETURNING occurred_at, campaign_id, department, event_type
+    ),
+    rolled_up AS (
+        INSERT INTO tracking_event_rollups (
+            bucket_size, bucket_start, campaign_id, department, event_type, event_count
+        )
+        SELECT
+            b.bucket_size,
+            DATE_TRUNC(b.bucket_size, i.occurred_at),
+            i.campaign_id,
+            COALESCE(i.department, ''),
+            i.event_type,
+            COUNT(*)
+        FROM inserted i
+        CROSS JOIN (VALUES ('minute'), ('hour')) AS b(bucket_size)
+        GROUP BY 1, 2, 3, 4, 5
+        ON CONFLICT (campaign_id, bucket_size, bucket_start, department, event_type)
+        DO UPDATE SET event_count = tracking_event_rollups.event_count + EXCLUDED.event_count
+    )
+    SELECT COUNT(*)::INTEGER FROM inserted;
+$$ LANGUAGE sql;
+
+-- Tracking ids written by the backend at send time; every tracking hit
+-- with a legacy (random) id is resolved through this index
+ALTER TABLE campaign_target_employees ADD COLUMN IF NOT EXISTS tracking_id TEXT;
+CREATE UNIQUE INDEX IF NOT EXISTS idx_campaign_target_employees_tracking_id
+    ON campaign_target_employees(tracking_id)
+    WHERE tracking_id IS NOT NULL;
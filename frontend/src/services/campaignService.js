@@ -378,6 +378,63 @@ export class CampaignService {
     }
   }
 
+  static subscribeToCampaignProgress(campaignId, onProgress, onUnavailable) {
+    // Pushes live send progress (counts, emails/sec, stage latencies, ETA)
+    // until the campaign finishes; returns a function that unsubscribes.
+    // Campaigns no sender has queued get onUnavailable and no progress.
+    const maxErrors = 5;
+    let errors = 0;
+    const source = new EventSource(
+      `${process.env.REACT_APP_BACKEND_URL}/api/campaigns/${campaignId}/progress/stream`,
+    );
+    source.addEventListener("progress", (event) => {
+      errors = 0;
+      const progress = JSON.parse(event.data);
+      onProgress(progress);
+      if (progress.finished) {
+        source.close();
+      }
+    });
+    source.addEventListener("unavailable", (event) => {
+      source.close();
+      if (onUnavailable) {
+        onUnavailable(JSON.parse(event.data));
+      }
+    });
+    source.onerror = (error) => {
+      console.error("Campaign progress stream error:", error);
+      // EventSource reconnects on its own; give up if the server keeps failing
+      errors += 1;
+      if (errors >= maxErrors) {
+        source.close();
+      }
+    };
+    return () => source.close();
+  }
+
+  // Get a campaign's event counts per "minute" or "hour" bucket
+  static async getCampaignTimeline(campaignId, options = {}) {
+    try {
+      const params = new URLSearchParams();
+      Object.entries(options).forEach(([key, value]) => {
+        if (value !== undefined && value !== null) {
+          params.append(key, value);
+        }
+      });
+      const response = await fetch(
+        `${process.env.REACT_APP_BACKEND_URL}/api/campaigns/${campaignId}/timeline?${params}`,
+      );
+      if (!response.ok) {
+        throw new Error(`Failed to fetch timeline for campaign ${campaignId}`);
+      }
+      const data = await response.json();
+      return { data: data.points, error: null };
+    } catch (error) {
+      console.error("Error fetching campaign timeline:", error);
+      return { data: null, error: error.message };
+    }
+  }
+
   static async getCampaignAnalytics(campaignIds) {
     try {
       const analyticsData = await Promise.all(
@@ -7,6 +7,7 @@ from sklearn.feature_extraction.text import TfidfVectorizer
 from sklearn.linear_model import LogisticRegression
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import accuracy_score
+from verdict_cache import VerdictCache, simhash
 
 nltk.download("stopwords")
 from nltk.corpus import stopwords
@@ -87,11 +88,30 @@ def psychology_risk(email):
 
     return min(score, 1.0), list(set(reasons))
 
-def analyze_email(email_text, sender_history_count):
-    content_score = content_risk(email_text, MODEL, VECTORIZER)
+VERDICT_CACHE = VerdictCache()
+
+def analyze_email(email_text, sender_history_count, use_cache=True):
+    cleaned = clean_text(email_text)
+    fingerprint = simhash(cleaned)
+
+    if use_cache:
+        cached = VERDICT_CACHE.lookup(fingerprint)
+    else:
+        cached = None
+        VERDICT_CACHE.record_bypass()
+
+    if cached is not None:
+        content_score = cached
+    else:
+        content_score = content_risk(cleaned, MODEL, VECTORIZER)
+        VERDICT_CACHE.store(fingerprint, content_score)
+
+    # Only the content model works on the fingerprinted text. Trigger words
+    # and links are matched in the raw message, which can differ between
+    # near-duplicates, so they are always scored on the actual message.
+    psych_score, psych_reasons = psychology_risk(email_text)
     url_score = url_risk(email_text)
     sender_score = sender_behavior(sender_history_count)
-    psych_score, psych_reasons = psychology_risk(email_text)
 
     final_score = (
         0.35 * content_score +
@@ -0,0 +1,231 @@
+import csv
+import math
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+DEFAULT_DB_PATH = os.getenv("SENDER_REPUTATION_DB", "sender_reputation.db")
+DEFAULT_HALF_LIFE_DAYS = float(os.getenv("SENDER_REPUTATION_HALF_LIFE_DAYS", "30"))
+
+
+def _decay_factor(age_seconds, half_life_seconds):
+    if age_seconds <= 0:
+        return 1.0
+    return math.pow(0.5, age_seconds / half_life_seconds)
+
+
+def _merge(score_a, updated_a, score_b, updated_b, half_life_seconds):
+    """Combine two decayed counts into one, anchored at the newer timestamp."""
+    updated = max(updated_a, updated_b)
+    score = score_a * _decay_factor(updated - updated_a, half_life_seconds)
+    score += score_b * _decay_factor(updated - updated_b, half_life_seconds)
+    return score, updated
+
+
+def sender_keys(sender):
+    """Return the (address, domain) keys tracked for a sender address."""
+    address = (sender or "").strip().lower()
+    if "<" in address and address.endswith(">"):
+        address = address[address.rindex("<") + 1:-1].strip()
+    if "@" not in address:
+        return None, None
+    return "addr:" + address, "domain:" + address.rsplit("@", 1)[1]
+
+
+class SenderReputationStore:
+    """Time-decayed message counts per sender address and domain.
+
+    Counts live in SQLite (WAL mode) with an LRU of recent keys in front of
+    it, so lookups on the hot path normally never touch the database.
+    History is loaded from mail logs with ``ingest``/``ingest_csv``; the
+    analyzer only looks it up. Recorded messages are buffered and written
+    in batches.
+    """
+
+    def __init__(
+        self,
+        db_path=DEFAULT_DB_PATH,
+        half_life_days=DEFAULT_HALF_LIFE_DAYS,
+        cache_size=100_000,
+        batch_size=500,
+        flush_interval=2.0,
+    ):
+        self.db_path = db_path
+        self.half_life_seconds = half_life_days * 86400
+        self.cache_size = cache_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self._cache = OrderedDict()
+        self._pending = {}
+        self._lock = threading.RLock()
+        self._last_flush = time.monotonic()
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.create_function("merge_score", 4, self._merge_score_sql)
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS sender_history (
+                key TEXT PRIMARY KEY,
+                score REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+
+    def _merge_score_sql(self, score_a, updated_a, score_b, updated_b):
+        return _merge(score_a, updated_a, score_b, updated_b, self.half_life_seconds)[0]
+
+    def _cache_put(self, key, state):
+        self._cache[key] = state
+        self._cache.move_to_end(key)
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _state(self, key):
+        state = self._cache.get(key)
+        if state is not None:
+            self._cache.move_to_end(key)
+            return state
+
+        row = self._conn.execute(
+            "SELECT score, updated_at FROM sender_history WHERE key = ?", (key,)
+        ).fetchone()
+        state = (row[0], row[1]) if row else (0.0, 0.0)
+        pending = self._pending.get(key)
+        if pending:
+            state = _merge(*state, *pending, self.half_life_seconds)
+        self._cache_put(key, state)
+        return state
+
+    def _score(self, key, now):
+        score, updated = self._state(key)
+        return score * _decay_factor(now - updated, self.half_life_seconds)
+
+    def lookup(self, sender, now=None):
+        """Return the decayed message counts for a sender's address and domain."""
+        address_key, domain_key = sender_keys(sender)
+        if address_key is None:
+            return {"address": 0.0, "domain": 0.0}
+
+        now = time.time() if now is None else now
+        with self._lock:
+            return {
+                "address": self._score(address_key, now),
+                "domain": self._score(domain_key, now),
+            }
+
+    def history_count(self, sender, now=None):
+        """Decayed number of messages previously seen from this address."""
+        return int(math.floor(self.lookup(sender, now)["address"] + 0.5))
+
+    def record(self, sender, timestamp=None):
+        """Count one message from ``sender``; written to disk on the next flush."""
+        address_key, domain_key = sender_keys(sender)
+        if address_key is None:
+            return
+
+        timestamp = time.time() if timestamp is None else timestamp
+        with self._lock:
+            for key in (address_key, domain_key):
+                self._cache_put(
+                    key, _merge(*self._state(key), 1.0, timestamp, self.half_life_seconds)
+                )
+                pending = self._pending.get(key, (0.0, timestamp))
+                self._pending[key] = _merge(
+                    *pending, 1.0, timestamp, self.half_life_seconds
+                )
+
+            if (
+                len(self._pending) >= self.batch_size
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            ):
+                self.flush()
+
+    def flush(self):
+        """Write all buffered counts to SQLite in a single transaction."""
+        with self._lock:
+            self._last_flush = time.monotonic()
+            if not self._pending:
+                return 0
+
+            rows = [(key, score, updated) for key, (score, updated) in self._pending.items()]
+            self._pending = {}
+            with self._conn:
+                self._conn.executemany(
+                    """
+                    INSERT INTO sender_history (key, score, updated_at)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT(key) DO UPDATE SET
+                        score = merge_score(score, updated_at, excluded.score, excluded.updated_at),
+                        updated_at = MAX(updated_at, excluded.updated_at)
+                    """,
+                    rows,
+                )
+            return len(rows)
+
+    def ingest(self, records):
+        """Bulk load ``(sender, timestamp)`` pairs, e.g. from historical mail logs.
+
+        Timestamps may be epoch seconds, ISO-8601 strings or datetimes and do
+        not need to be in order. Returns the number of messages ingested.
+        """
+        count = 0
+        with self._lock:
+            for sender, timestamp in records:
+                address_key, domain_key = sender_keys(sender)
+                if address_key is None:
+                    continue
+                ts = _parse_timestamp(timestamp)
+                for key in (address_key, domain_key):
+                    pending = self._pending.get(key, (0.0, ts))
+                    self._pending[key] = _merge(
+                        *pending, 1.0, ts, self.half_life_seconds
+                    )
+                    self._cache.pop(key, None)
+                count += 1
+                if len(self._pending) >= self.batch_size * 20:
+                    self.flush()
+            self.flush()
+        return count
+
+    def ingest_csv(self, path, sender_field="sender", time_field="timestamp"):
+        """Bulk load a CSV mail log with sender and timestamp columns."""
+        with open(path, newline="", encoding="utf-8") as f:
+            reader = csv.DictReader(f)
+            return self.ingest(
+                (row[sender_field], row.get(time_field)) for row in reader
+            )
+
+    def close(self):
+        self.flush()
+        self._conn.close()
+
+
+def _parse_timestamp(value):
+    if value is None or value == "":
+        return time.time()
+    if isinstance(value, datetime):
+        return value.timestamp()
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return datetime.fromisoformat(str(value)).timestamp()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != "ingest":
+        print("usage: python sender_reputation.py ingest <mail_log.csv> [...]")
+        sys.exit(1)
+
+    store = SenderReputationStore()
+    for log_path in sys.argv[2:]:
+        print(f"[INFO] Ingested {store.ingest_csv(log_path)} messages from {log_path}")
+    store.close()
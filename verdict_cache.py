@@ -0,0 +1,123 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+FINGERPRINT_BITS = 64
+
+
+def _token_hash(token):
+    return hashlib.blake2b(token.encode(), digest_size=8).digest()
+
+
+def simhash(text, shingle_size=3):
+    """64-bit SimHash of the word shingles in ``text``."""
+    words = text.split()
+    if len(words) < shingle_size:
+        shingles = [" ".join(words)] if words else []
+    else:
+        shingles = [
+            " ".join(words[i:i + shingle_size])
+            for i in range(len(words) - shingle_size + 1)
+        ]
+    if not shingles:
+        return 0
+
+    digests = np.frombuffer(b"".join(_token_hash(s) for s in shingles), dtype=np.uint8)
+    bits = np.unpackbits(digests.reshape(len(shingles), 8), axis=1)
+    majority = bits.sum(axis=0) * 2 > len(shingles)
+    return int.from_bytes(np.packbits(majority).tobytes(), "big")
+
+
+def similarity(a, b):
+    return 1.0 - bin(a ^ b).count("1") / FINGERPRINT_BITS
+
+
+class VerdictCache:
+    """Bounded LSH index of recent verdicts keyed by SimHash fingerprint.
+
+    The fingerprint is split into ``bands`` equal chunks; two fingerprints
+    within ``bands - 1`` differing bits are guaranteed to share a chunk, so a
+    lookup only compares against entries in the matching buckets.
+    """
+
+    def __init__(self, max_entries=50_000, threshold=0.95, ttl_seconds=3600, bands=4):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.bands = bands
+        self.band_bits = FINGERPRINT_BITS // bands
+
+        self._entries = OrderedDict()
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypassed = 0
+
+    def _band_keys(self, fingerprint):
+        mask = (1 << self.band_bits) - 1
+        return [
+            (band, fingerprint >> (band * self.band_bits) & mask)
+            for band in range(self.bands)
+        ]
+
+    def _remove(self, fingerprint):
+        self._entries.pop(fingerprint, None)
+        for key in self._band_keys(fingerprint):
+            bucket = self._buckets.get(key)
+            if bucket is not None:
+                bucket.discard(fingerprint)
+                if not bucket:
+                    del self._buckets[key]
+
+    def lookup(self, fingerprint):
+        """Return the cached verdict of the closest near-duplicate, or None."""
+        now = time.monotonic()
+        with self._lock:
+            best, best_sim = None, self.threshold
+            candidates = set()
+            for key in self._band_keys(fingerprint):
+                candidates.update(self._buckets.get(key, ()))
+
+            for candidate in candidates:
+                stored_at, verdict = self._entries[candidate]
+                if now - stored_at > self.ttl_seconds:
+                    self._remove(candidate)
+                    continue
+                sim = similarity(fingerprint, candidate)
+                if sim >= best_sim:
+                    best, best_sim = verdict, sim
+
+            if best is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return best
+
+    def store(self, fingerprint, verdict):
+        with self._lock:
+            if fingerprint in self._entries:
+                self._remove(fingerprint)
+            self._entries[fingerprint] = (time.monotonic(), verdict)
+            for key in self._band_keys(fingerprint):
+                self._buckets.setdefault(key, set()).add(fingerprint)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def record_bypass(self):
+        with self._lock:
+            self.bypassed += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }